@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import Awaitable, Callable, Iterable, Mapping, Optional, Union
+
+from pandas import DataFrame
+
+from utils.config import TIMEOUT
+from utils.gtables import google_table
+
+log = logging.getLogger(__name__)
+
+MAX_CONCURRENCY = 8
+
+
+class async_google_table:
+    """
+    asyncio counterpart of `google_table`: the same reading, conversion and
+    writing code runs in worker threads, bounded by `semaphore`; every http
+    request is limited by `request_timeout` and retried when it runs out
+    NOTE `timeout` of a whole call is off by default: a timed out call is not
+    stopped, its thread keeps sending requests and holds the `semaphore`
+    slot until it finishes, so retrying a timed out write may duplicate it
+    """
+
+    def __init__(
+        self,
+        table: str,
+        sheet: Union[str, int],
+        secret_json: Path,
+        column_dtypes: Mapping[str, type],
+        semaphore: Optional[asyncio.Semaphore] = None,
+        timeout: Optional[float] = None,
+        request_timeout: Optional[float] = TIMEOUT,
+    ) -> None:
+        # NOTE construction does no requests: login and fetching are lazy
+        self.sync_table = google_table(
+            table, sheet, secret_json, column_dtypes, timeout=request_timeout
+        )
+        self.semaphore = semaphore
+        self.timeout = timeout
+
+    async def run(self, func: Callable, *args, **kwargs):
+        if self.semaphore is not None:
+            await self.semaphore.acquire()
+        try:
+            task = asyncio.ensure_future(
+                asyncio.to_thread(func, *args, **kwargs)
+            )
+        except BaseException:
+            if self.semaphore is not None:
+                self.semaphore.release()
+            raise
+        task.add_done_callback(self.finished)
+        # NOTE shielded: a timeout or a cancel leaves the thread's task alone
+        return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+
+    def finished(self, task: asyncio.Future) -> None:
+        """
+        the worker thread is done: free the `semaphore` slot
+        """
+        if self.semaphore is not None:
+            self.semaphore.release()
+        if not task.cancelled() and task.exception() is not None:
+            # NOTE also retrieves the error of an abandoned call
+            log.debug(f"ошибка в фоновом вызове: '{task.exception()}'")
+
+    @property
+    def df_from_cloud(self) -> DataFrame:
+        return self.sync_table.df_from_cloud
+
+    async def download(self, **kwargs) -> DataFrame:
+        return await self.run(self.sync_table.download, **kwargs)
+
+    async def insert(self, dataframe: DataFrame, **kwargs) -> bool:
+        return await self.run(
+            self.sync_table.insert_into_same_sheet, dataframe, **kwargs
+        )
+
+    async def sync(self, dataframe: DataFrame, **kwargs) -> bool:
+        return await self.run(self.sync_table.sync, dataframe, **kwargs)
+
+    async def clear(self) -> None:
+        return await self.run(self.sync_table.clear)
+
+
+async def gather_limited(
+    awaitables: Iterable[Awaitable],
+    limit: int = MAX_CONCURRENCY,
+    return_exceptions: bool = False,
+) -> list:
+    """
+    `asyncio.gather` running at most `limit` of `awaitables` at once
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def limited(awaitable: Awaitable):
+        async with semaphore:
+            return await awaitable
+
+    return await asyncio.gather(
+        *map(limited, awaitables), return_exceptions=return_exceptions
+    )
+
+
+async def download_many(
+    tables: Mapping[str, async_google_table],
+    limit: int = MAX_CONCURRENCY,
+    return_exceptions: bool = False,
+    **kwargs,
+) -> dict:
+    """
+    download every table concurrently, dataframes under the same names
+    """
+    log.info(f"параллельная загрузка {len(tables)} листов")
+    results = await gather_limited(
+        [table.download(**kwargs) for table in tables.values()],
+        limit=limit,
+        return_exceptions=return_exceptions,
+    )
+    return dict(zip(tables.keys(), results))
@@ -0,0 +1,172 @@
+"""
+scaling benchmark of `google_table` against the in process fake backend
+
+    python -m utils.bench_gtables --rows 1000 10000 100000 --out bench.json
+
+every stage is timed for every (rows, columns mix) case, results are written
+as json to compare between commits; `--quota-error-rate` makes a share of
+upload requests fail with 429 to time the retries, backoff is shortened
+"""
+import argparse
+import json
+import logging
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from random import Random
+from time import perf_counter
+from typing import Callable, Dict, List
+
+import pandas
+
+from utils import gtables
+from utils.gfake import fake_client, install_fake
+from utils.utils import get_git_commit
+
+log = logging.getLogger(__name__)
+
+ROWS = [1000, 10000, 100000]
+COLUMNS = 10
+EMPTY_SHARE = 0.05
+# NOTE `gtables.BACKOFF_SECONDS` while benchmarking: real sleeps would
+# dominate the timings of quota errors
+BACKOFF_SECONDS = 0.001
+# NOTE column dtypes of every mix, repeated up to `COLUMNS` columns
+MIXES = {
+    "numbers": ["int", "number"],
+    "dates": ["date", "time"],
+    "strings": ["string", "bool"],
+    "mixed": ["int", "number", "date", "time", "string", "bool"],
+}
+
+
+def make_cell(dtype: str, random: Random):
+    """
+    one cell as the Sheets API returns it with `RENDER_OPTION`
+    """
+    if random.random() < EMPTY_SHARE:
+        return ""
+    if dtype == "int":
+        return random.randint(-(10 ** 6), 10 ** 6)
+    if dtype == "number":
+        if random.random() < 0.1:
+            # NOTE decimal comma in a text cell
+            return f"{random.uniform(0, 1e3):.2f}".replace(".", ",")
+        return random.uniform(-1e6, 1e6)
+    if dtype == "date":
+        return random.uniform(40000, 50000)
+    if dtype == "time":
+        return random.random()
+    if dtype == "bool":
+        return random.random() < 0.5
+    return f"text {random.randint(0, 1000)}"
+
+
+def make_sheet(rows: int, dtypes: List[str], seed: int = 42) -> list:
+    random = Random(seed)
+    header = [f"{dtype}_{num}" for num, dtype in enumerate(dtypes)]
+    return [header] + [
+        [make_cell(dtype, random) for dtype in dtypes] for _ in range(rows)
+    ]
+
+
+def timed(func: Callable, *args, **kwargs) -> float:
+    start = perf_counter()
+    func(*args, **kwargs)
+    return perf_counter() - start
+
+
+def run_case(
+    rows: int,
+    mix: str,
+    secret_json: Path,
+    latency: float = 0.0,
+    quota_error_rate: float = 0.0,
+) -> List[Dict]:
+    dtypes = (MIXES[mix] * COLUMNS)[:COLUMNS]
+    values = make_sheet(rows, dtypes)
+    column_dtypes = dict(zip(values[0], dtypes))
+    client = fake_client(latency=latency)
+    client.create("bench").add_worksheet("data", values)
+    previous = install_fake(client)
+    backoff = gtables.BACKOFF_SECONDS
+    gtables.BACKOFF_SECONDS = BACKOFF_SECONDS
+    try:
+        table = gtables.google_table(
+            "bench", "data", secret_json, column_dtypes
+        )
+        stages = {"login": timed(table._login)}
+        stages["fetch"] = timed(table.get_sheet)
+        stages["download"] = timed(table.download)
+        dataframe = table.df_from_cloud
+        stages["payload"] = timed(gtables.google_table.make_payload, dataframe)
+        # NOTE only uploads retry on quota errors, reads would just fail
+        client.quota_error_rate = quota_error_rate
+        requests = client.requests
+        stages["insert"] = timed(table.insert_into_same_sheet, dataframe)
+        requests = client.requests - requests
+    finally:
+        gtables.CLIENT_POOL = previous
+        gtables.BACKOFF_SECONDS = backoff
+    return [
+        dict(
+            stage=stage,
+            rows=rows,
+            mix=mix,
+            columns=COLUMNS,
+            quota_error_rate=quota_error_rate,
+            requests=requests if stage == "insert" else None,
+            seconds=seconds,
+            rows_per_second=rows / seconds if seconds else None,
+        )
+        for stage, seconds in stages.items()
+    ]
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=ROWS)
+    parser.add_argument("--mixes", nargs="+", default=list(MIXES))
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--quota-error-rate", type=float, default=0.0)
+    parser.add_argument("--out", type=Path, default=None)
+    args = parser.parse_args(argv)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        secret_json = Path(tmp, "fake-secret.json")
+        secret_json.write_text("{}")
+        for rows in args.rows:
+            for mix in args.mixes:
+                for result in run_case(
+                    rows,
+                    mix,
+                    secret_json,
+                    args.latency,
+                    args.quota_error_rate,
+                ):
+                    log.info(result)
+                    print(
+                        f"{result['stage']:>8} {rows:>7} {mix:>8} {result['seconds']:.4f}s",
+                        file=sys.stderr,
+                    )
+                    results.append(result)
+    report = dict(
+        benchmark="gtables",
+        commit=get_git_commit(Path(__file__).parent),
+        created=datetime.now().isoformat(),
+        python=sys.version,
+        pandas=pandas.__version__,
+        latency=args.latency,
+        quota_error_rate=args.quota_error_rate,
+        results=results,
+    )
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+micro-benchmarks of the text and timestamp functions of `utils.utils`
+on synthetic corpora
+
+    python -m utils.bench_utils --size 1000000 --out bench.json
+
+reports throughput (MB/s, items/s) and peak memory per function as json
+"""
+import argparse
+import json
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from random import Random
+from time import perf_counter
+from typing import Callable, Dict, List
+
+from utils import utils
+from utils.config import (
+    BASE_FILE_FORMAT,
+    FORMAT_DATETIME_FOR_READING,
+    FORMAT_TIME_NOTE,
+    strftime_local,
+)
+
+SIZE = 10 ** 6
+REPEAT = 3
+WORDS = ["заметка", "встреча", "note", "todo", "план", "идея", "42", "—"]
+START = datetime(2021, 1, 1)
+
+
+def make_text(size: int, random: Random) -> str:
+    words = []
+    length = 0
+    while length < size:
+        word = random.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def make_notes(
+    count: int,
+    size: int,
+    timestamp: str = BASE_FILE_FORMAT,
+    collisions: float = 0.0,
+    seed: int = 42,
+) -> str:
+    """
+    `count` notes of about `size` symbols each behind `timestamp` stamps,
+    a `collisions` share of notes repeats the previous stamp
+    """
+    random = Random(seed)
+    moment, notes = START, []
+    for _ in range(count):
+        if random.random() >= collisions:
+            moment += timedelta(minutes=random.randint(1, 600))
+        notes.append(
+            f"{strftime_local(moment, timestamp)}{make_text(size, random)}\n"
+        )
+    return "".join(notes)
+
+
+def make_dicts(count: int, size: int, seed: int = 42) -> List[Dict]:
+    """
+    `count` dicts with `size` keys each, all within the same few minutes
+    """
+    random = Random(seed)
+    return [
+        dict(
+            (START + timedelta(minutes=random.randint(0, 5)), num)
+            for num in range(size)
+        )
+        for _ in range(count)
+    ]
+
+
+def measure(
+    name: str, func: Callable, nbytes: int, items: int, repeat: int = REPEAT
+) -> Dict:
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        seconds = perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dict(
+        function=name,
+        seconds=best,
+        mb_per_second=nbytes / best / 2 ** 20 if nbytes and best else None,
+        items_per_second=items / best if items and best else None,
+        peak_memory_bytes=peak,
+    )
+
+
+def run(size: int = SIZE, repeat: int = REPEAT) -> List[Dict]:
+    random = Random(42)
+    count = max(size // 200, 1)
+    notes = make_notes(count, 200)
+    collided = make_notes(count, 200, collisions=0.9)
+    mixed = notes + make_notes(count, 200, FORMAT_TIME_NOTE)
+    candidates = [notes[i : i + 14] for i in range(0, 14 * 1000, 7)]
+    dicts = make_dicts(10, max(size // 2000, 1))
+    mapping = dict((num, num % 7) for num in range(max(size // 100, 1)))
+    raw = make_text(size, random).replace(" ", "  \t ")
+    cases = [
+        (
+            "parse_timestamp",
+            lambda: utils.parse_timestamp(notes, BASE_FILE_FORMAT),
+            len(notes.encode()),
+            count,
+        ),
+        (
+            "parse_timestamp_collisions",
+            lambda: utils.parse_timestamp(collided, BASE_FILE_FORMAT),
+            len(collided.encode()),
+            count,
+        ),
+        (
+            "parse_timestamp_mixed_formats",
+            lambda: utils.parse_timestamp(
+                mixed, (BASE_FILE_FORMAT, FORMAT_TIME_NOTE)
+            ),
+            len(mixed.encode()),
+            2 * count,
+        ),
+        (
+            "iter_timestamp_segments_chunks",
+            lambda: sum(
+                1
+                for _ in utils.iter_timestamp_segments(
+                    (notes[i : i + 4096] for i in range(0, len(notes), 4096)),
+                    BASE_FILE_FORMAT,
+                )
+            ),
+            len(notes.encode()),
+            count,
+        ),
+        (
+            "parse_timestamp_frame",
+            lambda: utils.parse_timestamp_frame(
+                notes.split("\n"), BASE_FILE_FORMAT
+            ),
+            len(notes.encode()),
+            count,
+        ),
+        (
+            "check_ts_mask",
+            lambda: [
+                utils.check_ts_mask(candidate, BASE_FILE_FORMAT)
+                for candidate in candidates
+            ],
+            0,
+            len(candidates),
+        ),
+        (
+            "get_ts_candidat_len",
+            lambda: [
+                utils.get_ts_candidat_len(BASE_FILE_FORMAT)
+                for _ in range(1000)
+            ],
+            0,
+            1000,
+        ),
+        (
+            "dict_union_with_ts_as_key",
+            lambda: utils.dict_union_with_ts_as_key(*dicts),
+            0,
+            sum(map(len, dicts)),
+        ),
+        (
+            "mirror_dict",
+            lambda: utils.mirror_dict(mapping),
+            0,
+            len(mapping),
+        ),
+        (
+            "prettify_input",
+            lambda: utils.prettify_input(raw, case="lower"),
+            len(raw.encode()),
+            1,
+        ),
+        (
+            "tokenizerTokens",
+            lambda: utils.tokenizerTokens.tokenize(raw),
+            len(raw.encode()),
+            1,
+        ),
+        (
+            "tokenizerWhtspsNewline",
+            lambda: utils.tokenizerWhtspsNewline.tokenize(raw),
+            len(raw.encode()),
+            1,
+        ),
+    ]
+    cyrillic = make_notes(count, 200, FORMAT_DATETIME_FOR_READING)
+    cases.append(
+        (
+            "parse_timestamp_cyrillic",
+            lambda: utils.parse_timestamp(
+                cyrillic, FORMAT_DATETIME_FOR_READING
+            ),
+            len(cyrillic.encode()),
+            count,
+        )
+    )
+    results = []
+    for name, func, nbytes, items in cases:
+        result = measure(name, func, nbytes, items, repeat)
+        print(
+            f"{name:>32} {result['seconds']:.4f}s {result['peak_memory_bytes'] / 2 ** 20:.1f}MB",
+            file=sys.stderr,
+        )
+        results.append(result)
+    return results
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=SIZE)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args(argv)
+    report = dict(
+        benchmark="utils",
+        commit=utils.get_git_commit(Path(__file__).parent),
+        created=datetime.now().isoformat(),
+        python=sys.version,
+        size=args.size,
+        results=run(args.size, args.repeat),
+    )
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import logging
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from utils import config
+
+log = logging.getLogger(__name__)
+
+# NOTE characters with a special meaning in a regular expression
+RE_SPECIAL = set(".^$*+?{}[]\\|()")
+RE_TEMPLATE_GROUPS = re.compile(r"\\(?:g<([^>]*)>|([0-9]{1,2})|.)", re.S)
+
+
+class rule(NamedTuple):
+    pattern: re.Pattern
+    replacement: Union[str, Callable[[re.Match], str]]
+    # NOTE only in POST_PATTERNS: tag of a hit and is it private
+    tag: Optional[str] = None
+    private: Optional[int] = None
+
+
+class cleaned(NamedTuple):
+    text: str
+    tags: Tuple[str, ...]
+    # NOTE the largest privacy flag of the hit rules, None without hits
+    private: Optional[int]
+
+
+def get_literal(pattern: re.Pattern) -> Optional[str]:
+    """
+    the one character `pattern` matches if it is a plain literal, else None
+    """
+    if pattern.flags & re.IGNORECASE:
+        return None
+    source = pattern.pattern
+    if isinstance(source, bytes):
+        return None
+    if len(source) == 1 and source not in RE_SPECIAL:
+        return source
+    if len(source) == 2 and source[0] == "\\" and not source[1].isalnum():
+        return source[1]
+    return None
+
+
+def check_replacement(pattern: re.Pattern, replacement: str) -> None:
+    for match in RE_TEMPLATE_GROUPS.finditer(replacement):
+        name, number = match.groups()
+        if name is None and number is None:
+            continue  # NOTE other escapes, like "\\n" or "\\\\"
+        if number is not None:
+            group = int(number)
+        elif name.isdigit():
+            group = int(name)
+        elif name in pattern.groupindex:
+            continue
+        else:
+            raise ValueError(
+                f"unknown group '{name}' in replacement '{replacement}'"
+            )
+        if group > pattern.groups:
+            raise ValueError(
+                f"invalid group {group} in replacement '{replacement}'"
+            )
+
+
+def make_rule(item: Union[tuple, list], num: int = 0) -> rule:
+    """
+    validate one (pattern, replacement[, tag, private]) item of config
+    pattern lists, raw strings are compiled
+    """
+    if not isinstance(item, (tuple, list)) or not 2 <= len(item) <= 4:
+        raise ValueError(
+            f"rule {num}: (pattern, replacement[, tag, private]) expected,"
+            f" got '{item}'"
+        )
+    pattern, replacement, *extra = item
+    try:
+        pattern = re.compile(pattern)
+    except (re.error, TypeError) as e:
+        raise ValueError(f"rule {num}: bad pattern '{pattern}': {e}") from e
+    if isinstance(replacement, str):
+        try:
+            check_replacement(pattern, replacement)
+        except ValueError as e:
+            raise ValueError(f"rule {num}: {e}") from e
+    elif not callable(replacement):
+        raise ValueError(f"rule {num}: bad replacement '{replacement}'")
+    tag, private = (extra + [None, None])[:2]
+    if tag is not None and not isinstance(tag, str):
+        raise ValueError(f"rule {num}: tag is not a string: '{tag}'")
+    if private is not None and not isinstance(private, int):
+        raise ValueError(f"rule {num}: bad privacy flag '{private}'")
+    return rule(pattern, replacement, tag, private)
+
+
+def fuse_rules(rules: Iterable[rule]) -> List[Union[rule, Dict[int, str]]]:
+    """
+    runs of untagged one character literal rules become one `str.translate`
+    table, which replaces all of them in a single pass; a rule joins the
+    run only if that gives the same result as applying the rules in order
+    """
+    steps = []
+    table: Dict[int, str] = dict()
+    outputs = ""
+    for rule_ in rules:
+        literal = get_literal(rule_.pattern)
+        fusable = (
+            literal is not None
+            and rule_.tag is None
+            and isinstance(rule_.replacement, str)
+            and "\\" not in rule_.replacement
+        )
+        if fusable and ord(literal) not in table and literal not in outputs:
+            table[ord(literal)] = rule_.replacement
+            outputs += rule_.replacement
+            continue
+        if table:
+            steps.append(table)
+            table, outputs = dict(), ""
+        if fusable:
+            table[ord(literal)] = rule_.replacement
+            outputs = rule_.replacement
+        else:
+            steps.append(rule_)
+    if table:
+        steps.append(table)
+    return steps
+
+
+class text_cleaner:
+    """
+    applies rule lists like `config.PRE_PATTERNS` in order, rules are
+    validated and compiled once; tagged rules report their hits
+    """
+
+    def __init__(self, *rule_lists: Iterable[tuple]) -> None:
+        self.rules = [
+            make_rule(item, num)
+            for num, item in enumerate(
+                item for rule_list in rule_lists for item in rule_list
+            )
+        ]
+        self.steps = fuse_rules(self.rules)
+        log.debug(f"правил {len(self.rules)}, шагов {len(self.steps)}")
+
+    def clean(self, text: str) -> cleaned:
+        tags, private = [], None
+        for step in self.steps:
+            if isinstance(step, dict):
+                text = text.translate(step)
+                continue
+            if step.tag is None and step.private is None:
+                text = step.pattern.sub(step.replacement, text)
+                continue
+            text, hits = step.pattern.subn(step.replacement, text)
+            if not hits:
+                continue
+            if step.tag is not None and step.tag not in tags:
+                tags.append(step.tag)
+            if step.private is not None:
+                private = (
+                    step.private
+                    if private is None
+                    else max(private, step.private)
+                )
+        return cleaned(text, tuple(tags), private)
+
+    __call__ = clean
+
+    def clean_many(
+        self,
+        texts: Iterable[str],
+        workers: Optional[int] = None,
+        chunksize: int = 64,
+    ) -> Iterator[cleaned]:
+        """
+        lazily clean a stream of notes in order, in a process pool when
+        `workers` is above 1
+        """
+        if workers is None or workers == 1:
+            yield from map(self.clean, texts)
+            return
+        # NOTE `pool.map` would read the whole stream at once, chunks are
+        # submitted as results are taken instead
+        texts = iter(texts)
+        chunks = iter(lambda: list(islice(texts, chunksize)), [])
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque(
+                pool.submit(self.clean_chunk, chunk)
+                for chunk in islice(chunks, 2 * workers)
+            )
+            while pending:
+                yield from pending.popleft().result()
+                for chunk in islice(chunks, 1):
+                    pending.append(pool.submit(self.clean_chunk, chunk))
+
+    def clean_chunk(self, texts: List[str]) -> List[cleaned]:
+        return list(map(self.clean, texts))
+
+    def clean_segments(
+        self, segments: Iterable[Tuple[object, str]], **kwargs
+    ) -> Iterator[Tuple[object, cleaned]]:
+        """
+        `clean_many` keeping keys, for (timestamp, note) pairs from
+        `utils.iter_timestamp_segments` or a parsed dict's items
+        """
+        keys = deque()
+
+        def split(segments):
+            for key, text in segments:
+                keys.append(key)
+                yield text
+
+        for result in self.clean_many(split(segments), **kwargs):
+            yield keys.popleft(), result
+
+
+@lru_cache(maxsize=None)
+def get_cleaner(*names: str) -> text_cleaner:
+    """
+    cached cleaner of config rule lists by their names
+    """
+    return text_cleaner(*(getattr(config, name) for name in names))
+
+
+def clean_note(text: str) -> cleaned:
+    return get_cleaner("PRE_PATTERNS", "POST_PATTERNS").clean(text)
+
+
+def clean_noise(text: str) -> str:
+    return get_cleaner("NOISE_PATTERNS").clean(text).text
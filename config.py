@@ -1,20 +1,31 @@
 import getpass
-import locale
 import os
 import re
 from datetime import datetime
+from functools import lru_cache
 from hashlib import md5
 
-from numpy import nan
-from pandas import NaT as nat
-
+# NOTE values below which cost syscalls, heavy imports or regex compilation
+# are computed on first access, see `LAZY` at the end
+# NOTE only picks the language of %A and %B names written by `strftime_local`,
+# the process locale is never switched
 LOCALE = "ru_RU.UTF-8"
-locale.setlocale(locale.LC_TIME, LOCALE)
+
 
 # NOTE general options
 DEBUG = False
+# NOTE per stage timings, see `utils.metrics`
+METRICS = False
 SEED = 42
-EMPTY_VALUES = set([nan, None, "", nat])
+
+
+def get_empty_values() -> set:
+    from numpy import nan
+    from pandas import NaT as nat
+
+    return set([nan, None, "", nat])
+
+
 # actively used in google spreadsheets
 TIMESTAMP_START = datetime(1899, 12, 30)
 
@@ -28,84 +39,226 @@ FORMAT_TIME_FOR_READING = "%Hч %Mмин"
 FORMAT_DATETIME_FOR_READING = (
     f"{FORMAT_DATE_FOR_READING} {FORMAT_TIME_FOR_READING}"
 )
+# means header of `create-time-note.sh`, example: "2021-09-09 07.50"
+FORMAT_TIME_NOTE = "%Y-%m-%d %H.%M"
+# NOTE formats searched at once by `utils.iter_ts_detections`
+NOTE_FORMATS = (
+    BASE_FILE_FORMAT,
+    FORMAT_DATETIME_FOR_READING,
+    FORMAT_TIME_NOTE,
+)
 STRFTIME = {"d": 2, "m": 2, "Y": 4, "H": 2, "M": 2}
-WEEK_DAYS_RU = {
-    "понед",
-    "вторн",
-    "среда",
-    "четве",
-    "пятни",
-    "суббо",
-    "воскр",
-}
-MONTHS_RU = {
-    "янв",
-    "фев",
-    "мар",
-    "апр",
-    "май",
-    "июн",
-    "июл",
-    "авг",
-    "сен",
-    "окт",
-    "ноя",
-    "дек",
-}
-MONTHS_EN = {
-    "jan",
-    "feb",
-    "mar",
-    "apr",
-    "may",
-    "jun",
-    "jul",
-    "aug",
-    "sep",
-    "oct",
-    "nov",
-    "dec",
-}
-WEEK_DAYS_EN = {
-    "monda",
-    "tuesd",
-    "wedne",
-    "thurs",
-    "frida",
-    "satur",
-    "sunda",
-}
+# NOTE month and week day names in every case and short form, the first
+# form is the one `strftime_local` writes; months start from 1, week days
+# from monday as 0 like `datetime.weekday`; the 3 letter month and 5 letter
+# week day prefixes of the former `MONTHS_*` and `WEEK_DAYS_*` sets stay
+MONTH_FORMS_RU = (
+    ("января", "январь", "январю", "январём", "январем", "январе", "янв"),
+    (
+        "февраля",
+        "февраль",
+        "февралю",
+        "февралём",
+        "февралем",
+        "феврале",
+        "фев",
+    ),
+    ("марта", "март", "марту", "мартом", "марте", "мар"),
+    ("апреля", "апрель", "апрелю", "апрелем", "апреле", "апр"),
+    ("мая", "май", "маю", "маем", "мае"),
+    ("июня", "июнь", "июню", "июнем", "июне", "июн"),
+    ("июля", "июль", "июлю", "июлем", "июле", "июл"),
+    ("августа", "август", "августу", "августом", "августе", "авг"),
+    (
+        "сентября",
+        "сентябрь",
+        "сентябрю",
+        "сентябрём",
+        "сентябрем",
+        "сентябре",
+        "сен",
+        "сент",
+    ),
+    (
+        "октября",
+        "октябрь",
+        "октябрю",
+        "октябрём",
+        "октябрем",
+        "октябре",
+        "окт",
+    ),
+    ("ноября", "ноябрь", "ноябрю", "ноябрём", "ноябрем", "ноябре", "ноя"),
+    (
+        "декабря",
+        "декабрь",
+        "декабрю",
+        "декабрём",
+        "декабрем",
+        "декабре",
+        "дек",
+    ),
+)
+WEEK_DAY_FORMS_RU = (
+    (
+        "понедельник",
+        "понедельника",
+        "понедельнику",
+        "понедельником",
+        "понедельнике",
+        "пн",
+        "понед",
+    ),
+    (
+        "вторник",
+        "вторника",
+        "вторнику",
+        "вторником",
+        "вторнике",
+        "вт",
+        "вторн",
+    ),
+    ("среда", "среды", "среде", "среду", "средой", "средою", "ср"),
+    (
+        "четверг",
+        "четверга",
+        "четвергу",
+        "четвергом",
+        "четверге",
+        "чт",
+        "четве",
+    ),
+    (
+        "пятница",
+        "пятницы",
+        "пятнице",
+        "пятницу",
+        "пятницей",
+        "пт",
+        "пятни",
+    ),
+    (
+        "суббота",
+        "субботы",
+        "субботе",
+        "субботу",
+        "субботой",
+        "сб",
+        "суббо",
+    ),
+    (
+        "воскресенье",
+        "воскресенья",
+        "воскресенью",
+        "воскресеньем",
+        "вс",
+        "воскр",
+    ),
+)
+MONTH_FORMS_EN = (
+    ("january", "jan"),
+    ("february", "feb"),
+    ("march", "mar"),
+    ("april", "apr"),
+    ("may",),
+    ("june", "jun"),
+    ("july", "jul"),
+    ("august", "aug"),
+    ("september", "sep", "sept"),
+    ("october", "oct"),
+    ("november", "nov"),
+    ("december", "dec"),
+)
+WEEK_DAY_FORMS_EN = (
+    ("monday", "mon", "monda"),
+    ("tuesday", "tue", "tues", "tuesd"),
+    ("wednesday", "wed", "wedne"),
+    ("thursday", "thu", "thur", "thurs"),
+    ("friday", "fri", "frida"),
+    ("saturday", "sat", "satur"),
+    ("sunday", "sun", "sunda"),
+)
+
+
+def get_name_numbers(forms: tuple, start: int = 0) -> dict:
+    return dict(
+        (name, num)
+        for num, names in enumerate(forms, start)
+        for name in names
+    )
+
+
+MONTHS_RU = get_name_numbers(MONTH_FORMS_RU, 1)
+MONTHS_EN = get_name_numbers(MONTH_FORMS_EN, 1)
+WEEK_DAYS_RU = get_name_numbers(WEEK_DAY_FORMS_RU)
+WEEK_DAYS_EN = get_name_numbers(WEEK_DAY_FORMS_EN)
+# NOTE names of both languages are parsed, any letter case; "num" is the
+# longest name
 STRFTIME_LOCAL = {
     "A": {
-        "num": 5,
-        "values": WEEK_DAYS_RU if LOCALE == "ru_RU.UTF-8" else WEEK_DAYS_EN,
+        "num": max(map(len, {**WEEK_DAYS_RU, **WEEK_DAYS_EN})),
+        "values": {**WEEK_DAYS_RU, **WEEK_DAYS_EN},
+        "forms": (
+            WEEK_DAY_FORMS_RU if LOCALE == "ru_RU.UTF-8" else WEEK_DAY_FORMS_EN
+        ),
     },
     "B": {
-        "num": 3,
-        "values": MONTHS_RU if LOCALE == "ru_RU.UTF-8" else MONTHS_EN,
+        "num": max(map(len, {**MONTHS_RU, **MONTHS_EN})),
+        "values": {**MONTHS_RU, **MONTHS_EN},
+        "forms": MONTH_FORMS_RU if LOCALE == "ru_RU.UTF-8" else MONTH_FORMS_EN,
     },
 }
 
 # NOTE datetime strings
-now = datetime.now()
-DATETIME_PREFIX = now.strftime(BASE_FILE_FORMAT)
-DATE = now.strftime(BASE_FORMAT_DATE)
-TIME = now.strftime(BASE_FORMAT_TIME)
-DATE_FOR_READING = now.strftime(FORMAT_DATE_FOR_READING)
-TIME_FOR_READING = now.strftime(FORMAT_TIME_FOR_READING)
+@lru_cache(maxsize=None)
+def get_now() -> datetime:
+    return datetime.now()
+
+
+def strftime_local(moment: datetime, format: str) -> str:
+    """
+    `strftime` with %A and %B names from `STRFTIME_LOCAL` tables, safe to
+    call from threads next to locale sensitive code
+    """
+
+    def get_name(match: re.Match) -> str:
+        key = match.group(1)
+        if key not in STRFTIME_LOCAL:
+            return match.group()
+        num = moment.weekday() if key == "A" else moment.month - 1
+        return STRFTIME_LOCAL[key]["forms"][num][0]
+
+    return moment.strftime(re.sub("%(.)", get_name, format))
+
+
+def strftime_now(format: str, localized: bool = False) -> str:
+    if localized:
+        return strftime_local(get_now(), format)
+    return get_now().strftime(format)
+
 
 # NOTE logging options
-NAME_NODE = os.uname().nodename
-NAME_OS = os.uname().sysname
-NAME_ARCH = os.uname().machine
-NAME_OS_VERSION = os.uname().release
+@lru_cache(maxsize=None)
+def get_uname() -> os.uname_result:
+    return os.uname()
+
+
+def get_login() -> str:
+    try:
+        return os.getlogin()
+    except OSError:
+        # NOTE no controlling terminal: daemons, cron, containers
+        return getpass.getuser()
+
+
+def get_idhash() -> str:
+    return md5(
+        bytes(f"{get_now()}+{__getattr__('NAME_USER')}", encoding="utf8")
+    ).hexdigest()
+
+
 NAME_PYTHON = os.sys.version
-NAME_LOGIN = os.getlogin()
-NAME_USER = getpass.getuser()
-IDHASH = md5(bytes(f"{now}+{NAME_USER}", encoding="utf8")).hexdigest()
-LOG_FORMAT = (
-    f"{IDHASH} %(asctime)s %(levelname)s %(name)s %(funcName)s: %(message)s"
-)
+
 
 # NOTE usefull regular expressions patterns
 RE_LINKS = r"https?:\S+|http?:\S+"
@@ -117,24 +270,36 @@ SEP = "\t"
 TAB = "".join(4 * " ")
 END_OF_LINE = ".\n"  # r".\n"
 NEWLINE_SUMBOL = "|"
-PRE_PATTERNS = [
-    # delete rubbish separators. change to 4 whitesapces for code blocks:
-    (re.compile(SEP), TAB),
-    # delete rubbish spaces at the end of line:
-    (re.compile("[\t ]+\n"), "\n"),
-    # delete rubbish newlines:
-    (re.compile("\n\n+"), "\n\n"),
-]
-NOISE_PATTERNS = [
-    (re.compile(f"{SEP}"), ". "),  # delete rubbish separators
-    (re.compile('"'), " ",),
-    (re.compile(r"\s+\n"), "\n"),  # delete empty lines and new lines
-    (r"(?:\.+)\n+", END_OF_LINE),
-]
+
+
+def get_pre_patterns() -> list:
+    return [
+        # delete rubbish separators. change to 4 whitesapces for code blocks:
+        (re.compile(SEP), TAB),
+        # delete rubbish spaces at the end of line:
+        (re.compile("[\t ]+\n"), "\n"),
+        # delete rubbish newlines:
+        (re.compile("\n\n+"), "\n\n"),
+    ]
+
+
+def get_noise_patterns() -> list:
+    return [
+        (re.compile(f"{SEP}"), ". "),  # delete rubbish separators
+        (re.compile('"'), " ",),
+        (re.compile(r"\s+\n"), "\n"),  # delete empty lines and new lines
+        (r"(?:\.+)\n+", END_OF_LINE),
+    ]
+
+
 google_meet = "Контактная.+\nСсылка на видеовстречу.+\nВы также можете позвонить по телефону.+\nДополнительные номера телефонов.+\n"
-POST_PATTERNS = [  # (паттерн, замена, тэг1, личное?)
-    (re.compile(google_meet), "", "рабочая встреча", -1),
-]
+
+
+def get_post_patterns() -> list:
+    return [  # (паттерн, замена, тэг1, личное?)
+        (re.compile(google_meet), "", "рабочая встреча", -1),
+    ]
+
 
 # NOTE network
 TIMEOUT = 3.027
@@ -159,3 +324,40 @@ DISK = "Yandex.Disk.localized"
 DIR_DATA = "-DATA"
 DIR_DEBUG = "-DEBUG"
 DIR_LOGS = "-LOGS"
+
+# NOTE lazily computed module attributes: name -> how to compute it
+LAZY = {
+    "EMPTY_VALUES": get_empty_values,
+    "now": get_now,
+    "DATETIME_PREFIX": lambda: strftime_now(BASE_FILE_FORMAT),
+    "DATE": lambda: strftime_now(BASE_FORMAT_DATE),
+    "TIME": lambda: strftime_now(BASE_FORMAT_TIME),
+    "DATE_FOR_READING": lambda: strftime_now(FORMAT_DATE_FOR_READING, True),
+    "TIME_FOR_READING": lambda: strftime_now(FORMAT_TIME_FOR_READING, True),
+    "NAME_NODE": lambda: get_uname().nodename,
+    "NAME_OS": lambda: get_uname().sysname,
+    "NAME_ARCH": lambda: get_uname().machine,
+    "NAME_OS_VERSION": lambda: get_uname().release,
+    "NAME_LOGIN": get_login,
+    "NAME_USER": getpass.getuser,
+    "IDHASH": get_idhash,
+    "LOG_FORMAT": lambda: (
+        f"{__getattr__('IDHASH')} %(asctime)s %(levelname)s %(name)s %(funcName)s: %(message)s"
+    ),
+    "PRE_PATTERNS": get_pre_patterns,
+    "NOISE_PATTERNS": get_noise_patterns,
+    "POST_PATTERNS": get_post_patterns,
+}
+
+
+def __getattr__(name: str):
+    if name in globals():
+        return globals()[name]
+    if name not in LAZY:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    globals()[name] = LAZY[name]()
+    return globals()[name]
+
+
+def __dir__() -> list:
+    return sorted(set(globals()) | set(LAZY))
@@ -0,0 +1,272 @@
+import json
+import logging
+from random import Random
+from time import sleep
+from typing import Dict, List, Optional
+
+from gspread.exceptions import APIError, SpreadsheetNotFound, WorksheetNotFound
+from gspread.utils import a1_range_to_grid_range
+
+from utils import gtables
+
+log = logging.getLogger(__name__)
+
+
+def to_json(body):
+    """
+    `body` as the API gets it: `requests` sends it through `json.dumps`, which
+    fails on numpy scalars and on date or time objects
+    """
+    return json.loads(json.dumps(body))
+
+
+class fake_response:
+    """
+    enough of `requests.Response` for `gspread.exceptions.APIError`
+    """
+
+    def __init__(self, status_code: int, payload: dict) -> None:
+        self.status_code = status_code
+        self.payload = payload
+        self.text = str(payload)
+
+    def json(self) -> dict:
+        return self.payload
+
+
+class fake_client:
+    """
+    in process stand-in for `gspread.Client`: spreadsheets live in memory,
+    every request sleeps `latency` seconds and fails with a 429 quota error
+    with probability `quota_error_rate`
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        quota_error_rate: float = 0.0,
+        seed: int = 42,
+    ) -> None:
+        self.latency = latency
+        self.quota_error_rate = quota_error_rate
+        self.random = Random(seed)
+        self.spreadsheets: Dict[str, fake_spreadsheet] = dict()
+        self.requests = 0
+        self.timeout: Optional[float] = None
+
+    def set_timeout(self, timeout: Optional[float] = None) -> None:
+        self.timeout = timeout
+
+    def call(self, name: str) -> None:
+        self.requests += 1
+        if self.latency:
+            sleep(self.latency)
+        if self.random.random() < self.quota_error_rate:
+            log.debug(f"fake quota error on '{name}'")
+            raise APIError(
+                fake_response(
+                    429,
+                    {
+                        "error": {
+                            "code": 429,
+                            "message": "Quota exceeded",
+                            "status": "RESOURCE_EXHAUSTED",
+                        }
+                    },
+                )
+            )
+
+    def create(self, title: str) -> "fake_spreadsheet":
+        spreadsheet = fake_spreadsheet(self, title)
+        self.spreadsheets[spreadsheet.id] = spreadsheet
+        return spreadsheet
+
+    def open(self, title: str) -> "fake_spreadsheet":
+        self.call("open")
+        for spreadsheet in self.spreadsheets.values():
+            if spreadsheet.title == title:
+                return spreadsheet
+        raise SpreadsheetNotFound(title)
+
+    def open_by_key(self, key: str) -> "fake_spreadsheet":
+        self.call("open_by_key")
+        if key not in self.spreadsheets:
+            raise SpreadsheetNotFound(key)
+        return self.spreadsheets[key]
+
+    def request(self, method: str, url: str, params: Optional[dict] = None):
+        # NOTE only Drive metadata, see `utils.snapshots.get_revision`
+        self.call("request")
+        key = url.rsplit("/", 1)[-1]
+        revision = self.spreadsheets[key].revision
+        return fake_response(200, {"modifiedTime": str(revision)})
+
+
+class fake_spreadsheet:
+    def __init__(self, client: fake_client, title: str) -> None:
+        self.client = client
+        self.title = title
+        self.id = f"fake-{len(client.spreadsheets)}-{title}"
+        self.worksheets: List[fake_worksheet] = list()
+        self.revision = 0
+
+    def add_worksheet(
+        self, title: str, values: Optional[list] = None
+    ) -> "fake_worksheet":
+        worksheet = fake_worksheet(self, title, len(self.worksheets), values)
+        self.worksheets.append(worksheet)
+        return worksheet
+
+    def worksheet(self, title: str) -> "fake_worksheet":
+        self.client.call("worksheet")
+        for worksheet in self.worksheets:
+            if worksheet.title == title:
+                return worksheet
+        raise WorksheetNotFound(title)
+
+    def get_worksheet(self, index: int) -> Optional["fake_worksheet"]:
+        self.client.call("get_worksheet")
+        return self.worksheets[index] if index < len(self.worksheets) else None
+
+    def split_range(self, range_: str):
+        title, _, cells = range_.rpartition("!")
+        if not title:
+            title, cells = cells, ""
+        worksheet = next(
+            w for w in self.worksheets if w.title == title.strip("'")
+        )
+        return worksheet, cells
+
+    def values_batch_get(
+        self, ranges: List[str], params: Optional[dict] = None
+    ) -> dict:
+        self.client.call("values_batch_get")
+        value_ranges = []
+        for range_ in ranges:
+            worksheet, cells = self.split_range(range_)
+            values = worksheet.read(cells or None)
+            value_ranges.append(
+                dict(range=range_, **({"values": values} if values else {}))
+            )
+        return {"spreadsheetId": self.id, "valueRanges": value_ranges}
+
+    def batch_update(self, body: dict) -> dict:
+        self.client.call("batch_update")
+        body = to_json(body)
+        for request in body["requests"]:
+            (kind, params), = request.items()
+            if kind == "updateCells":
+                start = params["start"]
+                worksheet = self.worksheets[start["sheetId"]]
+                for offset, row in enumerate(params["rows"]):
+                    worksheet.write(
+                        start.get("rowIndex", 0) + offset,
+                        start.get("columnIndex", 0),
+                        [
+                            next(iter(cell["userEnteredValue"].values()))
+                            if cell.get("userEnteredValue")
+                            else ""
+                            for cell in row.get("values", [])
+                        ],
+                    )
+            elif kind in ("deleteDimension", "insertDimension"):
+                grid = params["range"]
+                worksheet = self.worksheets[grid["sheetId"]]
+                start, end = grid["startIndex"], grid["endIndex"]
+                if grid["dimension"] != "ROWS":
+                    raise NotImplementedError(grid["dimension"])
+                if kind == "deleteDimension":
+                    del worksheet.values[start:end]
+                else:
+                    worksheet.values[start:start] = [
+                        [] for _ in range(end - start)
+                    ]
+            else:
+                raise NotImplementedError(kind)
+        self.revision += 1
+        return {"spreadsheetId": self.id, "replies": []}
+
+
+class fake_worksheet:
+    def __init__(
+        self,
+        spreadsheet: fake_spreadsheet,
+        title: str,
+        id: int,
+        values: Optional[list] = None,
+    ) -> None:
+        self.spreadsheet = spreadsheet
+        self.client = spreadsheet.client
+        self.title = title
+        self.id = id
+        self.values = [list(row) for row in values or []]
+
+    def read(self, range_: Optional[str] = None) -> list:
+        """
+        values of an A1 range trimmed like the Sheets API does it
+        """
+        grid = a1_range_to_grid_range(range_) if range_ else dict()
+        rows = self.values[
+            grid.get("startRowIndex", 0) : grid.get("endRowIndex")
+        ]
+        first, last = (
+            grid.get("startColumnIndex", 0),
+            grid.get("endColumnIndex"),
+        )
+        values = [row[first:last] for row in rows]
+        for row in values:
+            while row and row[-1] == "":
+                row.pop()
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def write(self, row_index: int, column_index: int, cells: list) -> None:
+        while len(self.values) <= row_index:
+            self.values.append([])
+        row = self.values[row_index]
+        if len(row) < column_index + len(cells):
+            row.extend([""] * (column_index + len(cells) - len(row)))
+        row[column_index : column_index + len(cells)] = cells
+
+    def get(
+        self, range_name: Optional[str] = None, **kwargs
+    ) -> List[list]:
+        self.client.call("get")
+        return self.read(range_name)
+
+    def batch_get(self, ranges: List[str], **kwargs) -> List[list]:
+        self.client.call("batch_get")
+        return [self.read(range_) for range_ in ranges]
+
+    def update(
+        self, range_name: str, values: list, raw: bool = True, **kwargs
+    ) -> dict:
+        self.client.call("update")
+        values = to_json(values)
+        grid = a1_range_to_grid_range(range_name)
+        for offset, row in enumerate(values):
+            self.write(
+                grid.get("startRowIndex", 0) + offset,
+                grid.get("startColumnIndex", 0),
+                list(row),
+            )
+        self.spreadsheet.revision += 1
+        return {"updatedRange": range_name}
+
+    def clear(self) -> None:
+        self.client.call("clear")
+        self.values = []
+        self.spreadsheet.revision += 1
+
+
+def install_fake(
+    client: fake_client,
+) -> gtables.client_pool:
+    """
+    point `google_table` and friends at `client`, returns the previous
+    pool to put back into `gtables.CLIENT_POOL` afterwards
+    """
+    previous = gtables.CLIENT_POOL
+    gtables.CLIENT_POOL = gtables.client_pool(lambda secret, scopes: client)
+    return previous
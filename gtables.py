@@ -1,16 +1,54 @@
 import logging
-from datetime import datetime, timedelta
-from string import ascii_uppercase
-from typing import Mapping, Union
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, time, timedelta
+from functools import lru_cache, partial
+from random import random
+from threading import Lock, RLock
+from time import sleep
+from types import MappingProxyType
+from typing import (
+    Callable,
+    Dict,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import gspread
 import numpy as np
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+from requests.exceptions import Timeout as RequestTimeout
 from oauth2client.service_account import ServiceAccountCredentials
-from pandas import DataFrame, to_datetime
+from pandas import (
+    DataFrame,
+    Index,
+    NaT,
+    Series,
+    Timedelta,
+    to_datetime,
+    to_numeric,
+    to_timedelta,
+)
+from pandas.api.types import (
+    infer_dtype,
+    is_datetime64_any_dtype,
+    is_string_dtype,
+)
 from pathlib import Path
 
+from utils import metrics
 from utils.config import TIMESTAMP_START
-from utils.utils import make_logging_config, mirror_dict, validate_path
+from utils.snapshots import get_revision, snapshot_cache
+from utils.utils import (
+    get_sheet_schema,
+    make_logging_config,
+    mirror_dict,
+    validate_path,
+)
 
 log = logging.getLogger(__name__)
 
@@ -18,6 +56,218 @@ GOOGLE_API_SCOPE = ["https://www.googleapis.com/auth/drive"]
 ENCODING = "utf-8-sig"
 RENDER_OPTION = "FORMULA"  # "UNFORMATTED_VALUE"
 FILLNA = ""
+MICROSECONDS_PER_DAY = 86400 * 10 ** 6
+DATETIME_KINDS = {"datetime", "datetime64", "date", "time"}
+# NOTE uploads: rows per request, parallel requests, retries on quota errors
+CHUNK_ROWS = 5000
+MAX_IN_FLIGHT = 4
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 1.0
+RETRY_STATUS_CODES = {429, 500, 503}
+# NOTE compact download: strings become categories below this unique share
+CATEGORY_MAX_SHARE = 0.5
+BOOL_STRINGS = {"TRUE": True, "FALSE": False}
+# NOTE declared dtypes which are never written as serial dates
+PLAIN_KINDS = {"int", "number", "bool"}
+
+
+def authorize_service_account(
+    secret_json: str, scopes: Sequence[str] = GOOGLE_API_SCOPE
+) -> gspread.Client:
+    creds = ServiceAccountCredentials.from_json_keyfile_name(
+        secret_json, scopes=scopes,
+    )
+    return gspread.authorize(creds)
+
+
+class client_pool:
+    """
+    process wide authorized clients keyed by service account json and
+    opened spreadsheets keyed by title and by key, shared between threads
+    `timeout` limits every http request of a client, clients and spreadsheets
+    of different timeouts are separate; None waits as long as it takes
+    NOTE tokens need no care here: gspread sends requests through google-auth
+    `AuthorizedSession`, which refreshes an expired token by itself
+    """
+
+    def __init__(
+        self,
+        authorize: Callable[
+            [str, Sequence[str]], gspread.Client
+        ] = authorize_service_account,
+    ) -> None:
+        self.authorize = authorize
+        self.lock = RLock()
+        self.clients = dict()
+        self.spreadsheets = dict()
+        # NOTE one lock per spreadsheet: slow opens do not block cache hits
+        self.open_locks = defaultdict(Lock)
+
+    @staticmethod
+    def get_secret(secret_json: Union[Path, str]) -> str:
+        return str(Path(secret_json).absolute())
+
+    def get_client(
+        self,
+        secret_json: Union[Path, str],
+        scopes: Sequence[str] = GOOGLE_API_SCOPE,
+        timeout: Optional[float] = None,
+    ) -> gspread.Client:
+        secret = client_pool.get_secret(secret_json)
+        with self.lock:
+            client = self.clients.get((secret, tuple(scopes), timeout))
+            if client is None:
+                log.info(f"авторизация по ключу '{secret}'")
+                # NOTE only real logins are timed, pooled clients cost nothing
+                with metrics.stage("gtables.login"):
+                    client = self.authorize(secret, scopes)
+                if timeout is not None:
+                    client.set_timeout(timeout)
+                self.clients[(secret, tuple(scopes), timeout)] = client
+        return client
+
+    def open(
+        self,
+        secret_json: Union[Path, str],
+        title: Optional[str] = None,
+        key: Optional[str] = None,
+        scopes: Sequence[str] = GOOGLE_API_SCOPE,
+        timeout: Optional[float] = None,
+    ) -> gspread.Spreadsheet:
+        if (title is None) == (key is None):
+            raise ValueError("exactly one of `title` and `key` is required")
+        secret = client_pool.get_secret(secret_json)
+        cache_key = (
+            (secret, timeout, "key", key)
+            if key
+            else (secret, timeout, "title", title)
+        )
+        with self.lock:
+            spreadsheet = self.spreadsheets.get(cache_key)
+        if spreadsheet is not None:
+            return spreadsheet
+        with self.open_locks[cache_key]:
+            with self.lock:
+                spreadsheet = self.spreadsheets.get(cache_key)
+            if spreadsheet is not None:
+                return spreadsheet
+            client = self.get_client(secret_json, scopes, timeout)
+            log.info(f"открытие таблицы '{key or title}'")
+            spreadsheet = (
+                client.open_by_key(key) if key else client.open(title)
+            )
+            with self.lock:
+                for alias in (
+                    cache_key,
+                    (secret, timeout, "title", spreadsheet.title),
+                    (secret, timeout, "key", spreadsheet.id),
+                ):
+                    self.spreadsheets[alias] = spreadsheet
+        return spreadsheet
+
+    def clear(self) -> None:
+        with self.lock:
+            self.clients.clear()
+            self.spreadsheets.clear()
+
+
+CLIENT_POOL = client_pool()
+
+
+class conversion_plan(NamedTuple):
+    """
+    what a schema means for reading and writing a sheet, built once per
+    schema by `get_conversion_plan` and shared by every table using it
+    NOTE read only: mappings are proxies, column groups are tuples
+    """
+
+    column_dtypes: Mapping[str, str]
+    dtype_columns: Mapping[str, Tuple[str, ...]]
+    converters: Mapping[str, Callable[[Series], Series]]
+    compactors: Mapping[str, Callable[[Series], Series]]
+    default_values: Mapping[str, object]
+
+    def convert(
+        self,
+        dataframe: DataFrame,
+        compact: bool = False,
+        float_dtype: str = "float64",
+    ) -> DataFrame:
+        for col in dataframe.columns:
+            if col not in self.converters:
+                message = f"В названии партии данных есть столбец '{col}', для которого не указан тип"
+                log.error(message)
+                raise KeyError(message)
+            goal_type = self.column_dtypes[col]
+            name = f"gtables.convert.{goal_type}"
+            with metrics.stage(name, len(dataframe)):
+                dataframe[col] = self.converters[col](dataframe[col])
+                if compact:
+                    dataframe[col] = self.compactors[col](
+                        dataframe[col], float_dtype=float_dtype
+                    )
+        return dataframe
+
+    def fill_defaults(self, dataframe: DataFrame) -> DataFrame:
+        """
+        copy of `dataframe` with empty cells set to schema defaults, the
+        same `dataframe` if there is nothing to fill
+        """
+        defaults = dict(
+            (col, value)
+            for col, value in self.default_values.items()
+            if col in dataframe.columns and dataframe[col].isna().any()
+        )
+        if not defaults:
+            return dataframe
+        return dataframe.fillna(defaults)
+
+
+def compile_conversion_plan(
+    column_dtypes: Tuple[Tuple[str, str], ...],
+    default_values: Tuple[Tuple[str, object], ...] = (),
+) -> conversion_plan:
+    column_dtypes = dict(column_dtypes)
+    converters, compactors = dict(), dict()
+    for col, goal_type in column_dtypes.items():
+        if not goal_type:
+            continue
+        converters[col] = partial(
+            google_table.convert_column, goal_type=goal_type
+        )
+        compactors[col] = partial(
+            google_table.compact_column, goal_type=goal_type
+        )
+    return conversion_plan(
+        MappingProxyType(column_dtypes),
+        MappingProxyType(
+            dict(
+                (dtype, tuple(columns))
+                for dtype, columns in mirror_dict(column_dtypes).items()
+            )
+        ),
+        MappingProxyType(converters),
+        MappingProxyType(compactors),
+        MappingProxyType(dict(default_values)),
+    )
+
+
+cached_conversion_plan = lru_cache(maxsize=256)(compile_conversion_plan)
+
+
+def get_conversion_plan(
+    column_dtypes: Mapping[str, str],
+    default_values: Optional[Mapping[str, object]] = None,
+) -> conversion_plan:
+    key = (
+        tuple(column_dtypes.items()),
+        tuple((default_values or {}).items()),
+    )
+    try:
+        return cached_conversion_plan(*key)
+    except TypeError:
+        # NOTE unhashable values, like lists of dtypes or default lists
+        return compile_conversion_plan(*key)
 
 
 class google_table:
@@ -27,36 +277,132 @@ class google_table:
         sheet: Union[str, int],
         secret_json: Path,
         column_dtypes: Mapping[str, type],
+        default_values: Optional[Mapping[str, object]] = None,
+        timeout: Optional[float] = None,
     ) -> None:
         self.table = table
         validate_path(secret_json.absolute(), endswith=".json")
         self.secret_json = secret_json
         self.scopes = GOOGLE_API_SCOPE
+        # NOTE seconds of one http request, None waits as long as it takes
+        self.timeout = timeout
         self.sheet_name = None if type(sheet) == int else sheet
         self.sheet_num = None if type(sheet) == str else sheet
         self.column_dtypes = column_dtypes
-        self.dtype_columns = mirror_dict(column_dtypes)
-        self._login()
-        self.get_sheet()
+        self.plan = get_conversion_plan(column_dtypes, default_values)
+        # NOTE a table's own copy, missing dtypes give empty lists as before
+        self.dtype_columns = defaultdict(
+            list,
+            (
+                (dtype, list(columns))
+                for dtype, columns in self.plan.dtype_columns.items()
+            ),
+        )
+        # NOTE login, worksheet opening and fetching happen on first use only
+        self._client = None
+        self._sheet_io = None
+        self._sheet = None
         pass
 
+    @classmethod
+    def from_schema(
+        cls,
+        table: str,
+        sheet: Union[str, int],
+        secret_json: Path,
+        schema_yaml: Path,
+    ) -> "google_table":
+        """
+        table typed by a yaml schema, parsed once for all tables sharing it
+        """
+        schema = get_sheet_schema(schema_yaml)
+        return cls(
+            table,
+            sheet,
+            secret_json,
+            schema.column_dtypes,
+            schema.default_values,
+        )
+
     def _login(self) -> gspread.Client:
-        self.creds = ServiceAccountCredentials.from_json_keyfile_name(
-            self.secret_json, scopes=self.scopes,
+        self._client = CLIENT_POOL.get_client(
+            self.secret_json, self.scopes, self.timeout
         )
-        self.client = gspread.authorize(self.creds)
-        return self.client
+        return self._client
+
+    @property
+    def client(self) -> gspread.Client:
+        return self._client or self._login()
+
+    @property
+    def creds(self):
+        """
+        google-auth credentials the shared client was authorized with
+        """
+        return getattr(getattr(self.client, "http_client", None), "auth", None)
+
+    @property
+    def sheet_io(self) -> gspread.Worksheet:
+        if self._sheet_io is None:
+            with metrics.stage("gtables.open"):
+                opened = CLIENT_POOL.open(
+                    self.secret_json,
+                    title=self.table,
+                    scopes=self.scopes,
+                    timeout=self.timeout,
+                )
+                self._sheet_io = (
+                    opened.worksheet(self.sheet_name)
+                    if self.sheet_name
+                    else opened.get_worksheet(self.sheet_num)
+                )
+        return self._sheet_io
+
+    @property
+    def sheet(self) -> list:
+        if self._sheet is None:
+            self.get_sheet()
+        return self._sheet
+
+    @sheet.setter
+    def sheet(self, values: Optional[list]) -> None:
+        self._sheet = values
 
     def get_sheet(self) -> gspread.Worksheet:
-        opened = self.client.open(self.table)
-        self.sheet_io = (
-            opened.worksheet(self.sheet_name)
-            if self.sheet_name
-            else opened.get_worksheet(self.sheet_num)
-        )
-        self.sheet = self.sheet_io.get(value_render_option=RENDER_OPTION)
+        sheet_io = self.sheet_io
+        with metrics.stage("gtables.get_sheet") as stage:
+            self.sheet = sheet_io.get(value_render_option=RENDER_OPTION)
+            stage.add(
+                rows=len(self.sheet), nbytes=metrics.get_size(self.sheet)
+            )
         return self.sheet
 
+    def get_values(self, *ranges: str) -> list:
+        """
+        values of A1 ranges in one request, a list of rows per range
+        """
+        sheet_io = self.sheet_io
+        with metrics.stage("gtables.get_values") as stage:
+            values = [
+                list(values)
+                for values in sheet_io.batch_get(
+                    list(ranges), value_render_option=RENDER_OPTION
+                )
+            ]
+            stage.add(
+                rows=sum(map(len, values)), nbytes=metrics.get_size(values)
+            )
+        return values
+
+    def get_header(self, header_line: int = 0) -> list:
+        (header,) = self.get_values(f"{header_line + 1}:{header_line + 1}")
+        self.header = header[0] if header else []
+        return self.header
+
+    @staticmethod
+    def column_letter(num: int) -> str:
+        return rowcol_to_a1(1, num)[:-1]
+
     def clear(self) -> None:
         self.sheet_io.clear()
         pass
@@ -124,58 +470,450 @@ class google_table:
             return bool(value)
         return value
 
-    def download(self, header_line=0) -> DataFrame:
-        self.df_from_cloud = DataFrame(
-            self.sheet[header_line+1:], columns=self.sheet[header_line])
-        for col in self.df_from_cloud.columns:
-            if not self.column_dtypes.get(col):
-                message = f"В названии партии данных есть столбец '{col}', для которого не указан тип"
+    @staticmethod
+    def calc_datetimes(days_since_1899: Series) -> Series:
+        """
+        vectorized `calc_datetime`: whole column of serial days to datetime64
+        rounded to microseconds, as `timedelta` does
+        """
+        days = days_since_1899.astype(float)
+        whole = np.trunc(days)
+        micros = (days - whole) * MICROSECONDS_PER_DAY
+        micros = whole * MICROSECONDS_PER_DAY + micros.round()
+        return TIMESTAMP_START + to_timedelta(micros, unit="us")
+
+    @staticmethod
+    def parse_datetimes(values: Series) -> Series:
+        try:
+            return to_datetime(values)
+        except (ValueError, TypeError):
+            # NOTE mixed formats in one column: fall back to per value parsing
+            return values.map(to_datetime)
+
+    @staticmethod
+    def convert_column(series: Series, goal_type: str = "int") -> Series:
+        """
+        column at a time counterpart of `convert_values`:
+        one vectorized operation per declared dtype instead of a call per cell
+        empty strings become NaN (numbers) or NaT (dates and times)
+        """
+        if goal_type not in ("int", "number", "date", "time", "bool"):
+            return series
+        is_blank = series.eq("")
+        if goal_type == "int":
+            values = np.trunc(to_numeric(series.mask(is_blank)))
+            return values if values.isna().any() else values.astype("int64")
+        if goal_type == "number":
+            values = to_numeric(series.mask(is_blank), errors="coerce")
+            failed = values.isna() & series.notna() & ~is_blank
+            if failed.any():
+                # NOTE comma as a decimal separator, raises like `float` does
+                commas = series[failed].astype(str)
+                values[failed] = to_numeric(
+                    commas.str.replace(",", ".", regex=False)
+                )
+            return values.astype(float)
+        kinds = series.map(type)
+        is_number = kinds.isin((int, float))
+        if goal_type == "bool":
+            values = series.astype(object)
+            values[is_number] = series[is_number].astype(bool)
+            return values.infer_objects()
+        is_time = kinds.eq(time)
+        datetimes = Series(NaT, index=series.index, dtype="datetime64[ns]")
+        datetimes[is_number] = google_table.calc_datetimes(series[is_number])
+        rest = ~(is_number | is_blank | is_time)
+        if rest.any():
+            datetimes[rest] = google_table.parse_datetimes(series[rest])
+        if goal_type == "date":
+            return datetimes
+        values = datetimes.dt.time.astype(object)
+        values[is_time] = series[is_time]
+        return values
+
+    @staticmethod
+    def make_frame(header: list, rows: list) -> DataFrame:
+        # NOTE sheets api trims trailing empty cells of a row
+        width = len(header)
+        return DataFrame(
+            [row + [FILLNA] * (width - len(row)) for row in rows],
+            columns=header,
+        )
+
+    @staticmethod
+    def compact_column(
+        series: Series,
+        goal_type: str = "string",
+        float_dtype: str = "float64",
+        category_max_share: float = CATEGORY_MAX_SHARE,
+    ) -> Series:
+        """
+        converted column in a memory efficient dtype: nullable "Int64" and
+        "boolean", `float_dtype` for numbers, "category" for strings with
+        few unique values; time columns stay objects
+        """
+        if goal_type == "int":
+            return series.astype("Int64")
+        if goal_type == "number":
+            return series.astype(float_dtype)
+        if goal_type == "bool":
+            values = series.replace(BOOL_STRINGS).mask(series.eq(""))
+            try:
+                return values.astype("boolean")
+            except (TypeError, ValueError) as e:
+                log.warning(f"столбец '{series.name}' оставлен как есть: {e}")
+                return series
+        if goal_type in ("date", "time") or not is_string_dtype(series):
+            return series
+        if len(series) and series.nunique() <= category_max_share * len(
+            series
+        ):
+            return series.astype("category")
+        return series
+
+    @staticmethod
+    def memory_usage(dataframe: DataFrame) -> Series:
+        """
+        bytes taken by every column, strings and categories included
+        """
+        return dataframe.memory_usage(index=False, deep=True)
+
+    @staticmethod
+    def convert_columns(
+        dataframe: DataFrame,
+        column_dtypes: Mapping[str, str],
+        compact: bool = False,
+        float_dtype: str = "float64",
+    ) -> DataFrame:
+        return get_conversion_plan(column_dtypes).convert(
+            dataframe, compact, float_dtype
+        )
+
+    def convert_frame(
+        self,
+        dataframe: DataFrame,
+        compact: bool = False,
+        float_dtype: str = "float64",
+    ) -> DataFrame:
+        return self.plan.convert(dataframe, compact, float_dtype)
+
+    def read_columns(
+        self,
+        columns: Sequence[str],
+        header_line: int = 0,
+        rows: Optional[Tuple[int, int]] = None,
+    ) -> DataFrame:
+        header = self.get_header(header_line)
+        missing = [col for col in columns if col not in header]
+        if missing:
+            message = f"в заголовке листа '{self.table}/{self.sheet_name}' нет столбцов {missing}"
+            log.error(message)
+            raise KeyError(message)
+        first, last = rows if rows else (header_line + 2, "")
+        letters = [
+            google_table.column_letter(header.index(col) + 1)
+            for col in columns
+        ]
+        values = self.get_values(
+            *[f"{letter}{first}:{letter}{last}" for letter in letters]
+        )
+        height = max(map(len, values), default=0)
+        return DataFrame(
+            dict(
+                (
+                    col,
+                    [row[0] if row else FILLNA for row in cells]
+                    + [FILLNA] * (height - len(cells)),
+                )
+                for col, cells in zip(columns, values)
+            )
+        )
+
+    @metrics.timed("gtables.download")
+    def download(
+        self,
+        header_line: int = 0,
+        range_: Optional[str] = None,
+        rows: Optional[Tuple[int, int]] = None,
+        columns: Optional[Sequence[str]] = None,
+        cache: Optional[snapshot_cache] = None,
+        compact: bool = False,
+        float_dtype: str = "float64",
+    ) -> DataFrame:
+        """
+        typed dataframe of the sheet, or only of a part of it:
+        `range_` - A1 range including the header, like "B3:F200"
+        `rows` - first and last sheet row numbers of data, like (2, 1001)
+        `columns` - header names, only these columns are fetched
+        `cache` - local snapshots reused while the spreadsheet is unchanged
+        `compact` - memory efficient dtypes, see `compact_column`, and the
+        raw values of the sheet are dropped once converted
+        `float_dtype` - dtype of compact number columns, like "float32"
+        """
+        if cache:
+            read_options = dict(
+                header_line=header_line,
+                range_=range_,
+                rows=rows,
+                columns=columns,
+            )
+            if compact:
+                # NOTE keys of plain snapshots stay as they were
+                read_options.update(compact=compact)
+                if float_dtype != "float64":
+                    read_options.update(float_dtype=float_dtype)
+            key = cache.get_key(
+                self.table,
+                self.sheet_name or self.sheet_num,
+                read_options,
+                self.column_dtypes,
+            )
+            revision = None
+            if not cache.offline:
+                revision = get_revision(self.sheet_io.spreadsheet)
+            cached = cache.get(key, revision)
+            if cached is not None:
+                dataframe, meta = cached
+                self.first_row = meta["first_row"]
+                self.column_numbers = meta["column_numbers"]
+                for col in self.dtype_columns.get("time", []):
+                    # NOTE arrow reads missing times back as None
+                    dataframe[col] = dataframe[col].where(
+                        dataframe[col].notna(), NaT
+                    )
+                self.df_from_cloud = dataframe
+                return self.df_from_cloud
+            if cache.offline:
+                message = f"нет снимка '{self.table}/{self.sheet_name}' для работы без сети"
                 log.error(message)
                 raise KeyError(message)
-            self.df_from_cloud[col] = self.df_from_cloud[col].apply(
-                lambda v: google_table.convert_values(
-                    v, self.column_dtypes.get(col)
-                )
+        first_row, first_column = header_line + 2, 1
+        if columns:
+            dataframe = self.read_columns(columns, header_line, rows)
+        elif range_:
+            (values,) = self.get_values(range_)
+            dataframe = google_table.make_frame(
+                values[header_line], values[header_line + 1 :]
+            )
+            start = range_.split("!")[-1].split(":")[0]
+            row, column = a1_to_rowcol(
+                start if start[-1:].isdigit() else f"{start}1"
+            )
+            first_row, first_column = row + header_line + 1, column
+        elif rows:
+            header, values = self.get_values(
+                f"{header_line + 1}:{header_line + 1}", f"{rows[0]}:{rows[1]}"
+            )
+            dataframe = google_table.make_frame(header[0], values)
+        else:
+            dataframe = google_table.make_frame(
+                self.sheet[header_line], self.sheet[header_line + 1 :]
+            )
+        # NOTE where the data came from, used to write changes back
+        self.first_row = rows[0] if rows else first_row
+        self.column_numbers = (
+            [self.header.index(col) + 1 for col in columns]
+            if columns
+            else list(range(first_column, first_column + dataframe.shape[1]))
+        )
+        with metrics.stage("gtables.convert", len(dataframe)) as stage:
+            self.df_from_cloud = self.convert_frame(
+                dataframe, compact, float_dtype
+            )
+            stage.add(nbytes=metrics.get_size(self.df_from_cloud))
+        if compact:
+            self.sheet = None
+            memory = google_table.memory_usage(self.df_from_cloud)
+            log.info(
+                f"лист '{self.table}/{self.sheet_name}' занимает {memory.sum()} байт: {memory.to_dict()}"
+            )
+        if cache:
+            cache.put(
+                key,
+                self.df_from_cloud,
+                revision,
+                first_row=self.first_row,
+                column_numbers=self.column_numbers,
             )
         return self.df_from_cloud
 
+    @staticmethod
+    def get_datetime_kind(
+        series: Series, goal_type: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        "date" or "time" if the column is written as serial numbers, else None
+        a declared date or time `goal_type` wins over looking at values
+        """
+        if goal_type in ("date", "time"):
+            return goal_type
+        if goal_type in PLAIN_KINDS:
+            return None
+        if is_datetime64_any_dtype(series):
+            return "date"
+        if series.dtype != object:
+            return None
+        # NOTE blank cells are NaT, `infer_dtype` calls times with them mixed
+        kind = infer_dtype(series[series.notna()], skipna=True)
+        if kind == "time":
+            return "time"
+        return "date" if kind in DATETIME_KINDS else None
+
+    @staticmethod
+    def get_gspread_dates(series: Series, kind: str = "date") -> Series:
+        """
+        vectorized `get_gspread_date` for a whole date or time column, times
+        are fractions of a day
+        """
+        notna = series[series.notna()]
+        if kind == "time":
+            if is_datetime64_any_dtype(notna):
+                since_midnight = notna - notna.dt.normalize()
+            else:
+                since_midnight = to_timedelta(notna.astype(str))
+            return (since_midnight / Timedelta(days=1)).reindex(series.index)
+        if not is_datetime64_any_dtype(series):
+            series = to_datetime(series)
+        return (series - TIMESTAMP_START) / Timedelta(days=1)
+
+    @staticmethod
+    def encode_column(
+        series: Series, goal_type: Optional[str] = None
+    ) -> np.ndarray:
+        """
+        cell values of a column as sent to the sheet, an object array
+        date and time columns are found from the declared `goal_type` first
+        """
+        kind = google_table.get_datetime_kind(series, goal_type)
+        if kind is not None:
+            series = google_table.get_gspread_dates(series, kind)
+        values = series.to_numpy(dtype=object)
+        return np.where(series.isna(), FILLNA, values)
+
+    @staticmethod
+    def make_payload(
+        dataframe: DataFrame,
+        header: bool = True,
+        column_dtypes: Optional[Mapping[str, str]] = None,
+    ) -> list:
+        """
+        list of rows for `update`: date and time columns as serial numbers,
+        missing values as `FILLNA`; `dataframe` itself stays untouched
+        """
+        column_dtypes = column_dtypes or dict()
+        with metrics.stage("gtables.payload", len(dataframe)) as stage:
+            columns = [
+                google_table.encode_column(series, column_dtypes.get(col))
+                for col, series in dataframe.items()
+            ]
+            rows = list(map(list, zip(*columns)))
+            stage.add(nbytes=metrics.get_size(rows))
+        return ([dataframe.columns.values.tolist()] if header else []) + rows
+
+    @staticmethod
+    def is_quota_error(error: Exception) -> bool:
+        response = getattr(error, "response", None)
+        return getattr(response, "status_code", None) in RETRY_STATUS_CODES
+
+    @staticmethod
+    def with_retries(
+        description: str,
+        func: Callable,
+        *args,
+        retry_timeouts: bool = True,
+        **kwargs,
+    ):
+        """
+        call `func` backing off exponentially with jitter on quota errors
+        and on timed out requests unless `retry_timeouts` is off, for calls
+        which must not be repeated after they might have reached the API
+        """
+        retryable = (gspread.exceptions.APIError,) + (
+            (RequestTimeout,) if retry_timeouts else ()
+        )
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except retryable as e:
+                if attempt == MAX_RETRIES or not (
+                    isinstance(e, RequestTimeout)
+                    or google_table.is_quota_error(e)
+                ):
+                    raise
+                delay = BACKOFF_SECONDS * 2 ** attempt * (1 + random())
+                metrics.count("gtables.retries", retries=1)
+                reason = (
+                    "истекло время запроса"
+                    if isinstance(e, RequestTimeout)
+                    else "превышена квота"
+                )
+                log.warning(
+                    f"{reason} при загрузке '{description}', повтор {attempt + 1} через {delay:.1f} сек"
+                )
+                sleep(delay)
+
+    def update_with_retries(
+        self, range_: str, values: list, update: Optional[Callable] = None
+    ) -> None:
+        """
+        `update` is the bound `Worksheet.update`, `self.sheet_io` by default
+        """
+        update = update or self.sheet_io.update
+        with metrics.stage(
+            "gtables.update", len(values), metrics.get_size(values)
+        ):
+            google_table.with_retries(
+                range_, update, range_, values, raw=False
+            )
+
+    @metrics.timed("gtables.insert")
     def insert_into_same_sheet(
         self,
-        dataframe: DataFrame,  # TODO should I copy 'dataframe' before?
+        dataframe: DataFrame,  # NOTE is never copied or mutated
         startswith: int = 1,
         endswith: int = -1,
         header: bool = True,
+        chunk_rows: int = CHUNK_ROWS,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        progress: Optional[Callable[[int, int], None]] = None,
     ) -> bool:
-        for col in dataframe.columns:
-            is_datetime = False
-            series = dataframe[col]
-            mask = series.notna()
-            notna = series[mask]
-            if len(notna) == 0:
-                continue
-            sample = notna.sample(1).iloc[0]
-            is_datetime = (
-                True
-                if (
-                    ("date" in type(sample).__name__.lower())
-                    or ("time" in type(sample).__name__.lower())
-                )
-                else False
-            )
-            if not is_datetime:
-                continue
-            dataframe[col] = dataframe[col].apply(
-                lambda dt: google_table.get_gspread_date(dt)
+        """
+        upload rows in chunks of `chunk_rows`, at most `max_in_flight`
+        requests at a time; `progress(done, total)` is called per chunk
+        empty cells are written as schema defaults, see `fill_defaults`
+        """
+        dataframe = self.plan.fill_defaults(dataframe)
+        payload = google_table.make_payload(
+            dataframe, header=header, column_dtypes=self.plan.column_dtypes
+        )
+        if endswith != -1:
+            payload = payload[: max(endswith - startswith + 1, 0)]
+        last_column = google_table.column_letter(max(dataframe.shape[1], 1))
+        chunks = []
+        for first in range(0, len(payload), chunk_rows):
+            values = payload[first : first + chunk_rows]
+            row = startswith + first
+            chunks.append(
+                (f"A{row}:{last_column}{row + len(values) - 1}", values)
             )
-        dataframe.fillna(FILLNA, inplace=True)
         # NOTE сейчас будет выполнена выгрузка в cloud
+        pool = ThreadPoolExecutor(max_workers=max_in_flight)
         try:
-            self.sheet_io.update(
-                f"A{startswith}:{ascii_uppercase[dataframe.shape[1]]}{dataframe.shape[0]+startswith if endswith==-1 else endswith}",
-                ([dataframe.columns.values.tolist()] if header else [])
-                + dataframe.values.tolist(),
-                raw=False,
-            )
+            # NOTE opened once here, not by every worker of a fresh table
+            sheet_io = self.sheet_io
+            futures = [
+                pool.submit(
+                    self.update_with_retries, range_, values, sheet_io.update
+                )
+                for range_, values in chunks
+            ]
+            for done, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                log.info(
+                    f"загружено частей {done}/{len(chunks)} в '{self.table}/{self.sheet_name}'"
+                )
+                if progress:
+                    progress(done, len(chunks))
             download_success = True
             log.info(
                 f"загрузка таблицы в google tables '{self.table}/{self.sheet_name}' прошла успешно"
@@ -187,9 +925,210 @@ class google_table:
             )
             download_success = False
         finally:
-            pass
+            pool.shutdown(cancel_futures=True)
         return download_success
 
+    @staticmethod
+    def get_cell_data(value) -> dict:
+        if isinstance(value, str) and value == FILLNA:
+            return {}
+        if isinstance(value, (bool, np.bool_)):
+            return {"userEnteredValue": {"boolValue": bool(value)}}
+        if isinstance(value, (int, float, np.number)):
+            return {"userEnteredValue": {"numberValue": float(value)}}
+        value = str(value)
+        if value.startswith("="):
+            return {"userEnteredValue": {"formulaValue": value}}
+        return {"userEnteredValue": {"stringValue": value}}
+
+    def get_cells_requests(
+        self, row_index: int, cells: Mapping[int, object]
+    ) -> list:
+        """
+        `updateCells` requests for one sheet row (0-based), `cells` maps
+        0-based sheet column to a value; adjacent columns share a request
+        """
+        requests, run = [], []
+        for column in sorted(cells):
+            if run and column != run[-1] + 1:
+                requests.append(self.get_run_request(row_index, run, cells))
+                run = []
+            run.append(column)
+        if run:
+            requests.append(self.get_run_request(row_index, run, cells))
+        return requests
+
+    def get_run_request(
+        self, row_index: int, run: list, cells: Mapping[int, object]
+    ) -> dict:
+        return {
+            "updateCells": {
+                "start": {
+                    "sheetId": self.sheet_io.id,
+                    "rowIndex": row_index,
+                    "columnIndex": run[0],
+                },
+                "rows": [
+                    {
+                        "values": [
+                            google_table.get_cell_data(cells[column])
+                            for column in run
+                        ]
+                    }
+                ],
+                "fields": "userEnteredValue",
+            }
+        }
+
+    @metrics.timed("gtables.sync")
+    def sync(self, dataframe: DataFrame, key: Optional[str] = None) -> bool:
+        """
+        write only the difference between `dataframe` and the last
+        `download` result in one `batch_update`: changed cells, deleted rows
+        and inserted rows (added after the last row of the downloaded data)
+        rows are matched by values of the `key` column or by position
+        empty cells are written as schema defaults, see `fill_defaults`
+        """
+        dataframe = self.plan.fill_defaults(dataframe)
+        snapshot = self.df_from_cloud
+        dataframe = dataframe[list(snapshot.columns)]
+        if key:
+            old_keys, new_keys = Index(snapshot[key]), Index(dataframe[key])
+            if not (old_keys.is_unique and new_keys.is_unique):
+                message = f"значения ключа '{key}' не уникальны"
+                log.error(message)
+                raise ValueError(message)
+            matches = new_keys.get_indexer(old_keys)
+            inserted = np.flatnonzero(old_keys.get_indexer(new_keys) == -1)
+        else:
+            matches = np.arange(len(snapshot))
+            matches[matches >= len(dataframe)] = -1
+            inserted = np.arange(len(snapshot), len(dataframe))
+        kept, deleted = np.flatnonzero(matches != -1), np.flatnonzero(
+            matches == -1
+        )
+
+        first_index = self.first_row - 1
+        changed = defaultdict(dict)
+        new_columns = []
+        for num, col in enumerate(snapshot.columns):
+            goal_type = self.plan.column_dtypes.get(col)
+            old = google_table.encode_column(snapshot[col], goal_type)[kept]
+            new = google_table.encode_column(dataframe[col], goal_type)
+            new_columns.append(new)
+            new = new[matches[kept]]
+            for position in np.flatnonzero(old != new):
+                changed[int(first_index + kept[position])][
+                    self.column_numbers[num] - 1
+                ] = new[position]
+        requests = [
+            request
+            for row_index in sorted(changed)
+            for request in self.get_cells_requests(
+                row_index, changed[row_index]
+            )
+        ]
+        # NOTE runs of adjacent rows bottom up, so next row indexes stay valid
+        runs = np.split(deleted, np.flatnonzero(np.diff(deleted) != 1) + 1)
+        for run in reversed([run for run in runs if len(run)]):
+            requests.append(
+                {
+                    "deleteDimension": {
+                        "range": {
+                            "sheetId": self.sheet_io.id,
+                            "dimension": "ROWS",
+                            "startIndex": int(first_index + run[0]),
+                            "endIndex": int(first_index + run[-1] + 1),
+                        }
+                    }
+                }
+            )
+        if len(inserted):
+            end = first_index + len(kept)
+            requests.append(
+                {
+                    "insertDimension": {
+                        "range": {
+                            "sheetId": self.sheet_io.id,
+                            "dimension": "ROWS",
+                            "startIndex": end,
+                            "endIndex": end + len(inserted),
+                        },
+                        "inheritFromBefore": end > 0,
+                    }
+                }
+            )
+            for offset, position in enumerate(inserted):
+                requests.extend(
+                    self.get_cells_requests(
+                        end + offset,
+                        dict(
+                            (number - 1, values[position])
+                            for number, values in zip(
+                                self.column_numbers, new_columns
+                            )
+                        ),
+                    )
+                )
+        log.info(
+            f"синхронизация '{self.table}/{self.sheet_name}': изменено строк {len(changed)}, удалено {len(deleted)}, добавлено {len(inserted)}"
+        )
+        if not requests:
+            return True
+        try:
+            google_table.with_retries(
+                f"{self.table}/{self.sheet_name}",
+                self.sheet_io.spreadsheet.batch_update,
+                {"requests": requests},
+                # NOTE rows inserted or deleted twice are not the same sheet
+                retry_timeouts=not (len(deleted) or len(inserted)),
+            )
+        except Exception as e:
+            e = str(e).replace("'", '"')
+            log.error(
+                f"при синхронизации '{self.table}/{self.sheet_name}' возникла ошибка '{e}'"
+            )
+            return False
+        order = np.concatenate([matches[kept], inserted]).astype(int)
+        self.df_from_cloud = dataframe.iloc[order].reset_index(drop=True)
+        return True
+
+
+@metrics.timed("gtables.batch_download")
+def batch_download(
+    table: str,
+    secret_json: Path,
+    schemas: Mapping[str, Mapping[str, str]],
+    header_line: int = 0,
+    compact: bool = False,
+    float_dtype: str = "float64",
+) -> Dict[str, DataFrame]:
+    """
+    several sheets or ranges of one spreadsheet in one `values_batch_get`
+    `schemas` maps A1 range, like "Лист1" or "'Лист 2'!A1:F100",
+    to `column_dtypes` of that range; typed dataframes under the same keys
+    """
+    validate_path(secret_json.absolute(), endswith=".json")
+    spreadsheet = CLIENT_POOL.open(secret_json, title=table)
+    response = google_table.with_retries(
+        table,
+        spreadsheet.values_batch_get,
+        list(schemas),
+        params={"valueRenderOption": RENDER_OPTION},
+    )
+    frames = dict()
+    for range_, value_range in zip(schemas, response["valueRanges"]):
+        values = value_range.get("values", [])
+        header = values[header_line] if len(values) > header_line else []
+        frames[range_] = google_table.convert_columns(
+            google_table.make_frame(header, values[header_line + 1 :]),
+            schemas[range_],
+            compact,
+            float_dtype,
+        )
+    log.info(f"из таблицы '{table}' загружено диапазонов: {len(frames)}")
+    return frames
+
 
 def test() -> None:
     make_logging_config(debug=True)
@@ -0,0 +1,211 @@
+"""
+per stage timings and counters of gtables and utils hot paths
+
+    from utils import metrics
+    metrics.enable()
+    ...
+    metrics.METRICS.log_summary()
+
+off by default: `stage` then returns a shared no-op and costs one check
+"""
+import json
+import logging
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, Optional
+
+from utils import config
+
+log = logging.getLogger(__name__)
+
+ENABLED = config.METRICS
+
+
+class stage_stats:
+    __slots__ = ("calls", "seconds", "max_seconds", "rows", "bytes", "retries")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.retries = 0
+
+    def as_dict(self) -> dict:
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+
+class metrics_registry:
+    """
+    thread safe totals of every stage since the last `reset`
+    """
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.stages: Dict[str, stage_stats] = dict()
+
+    def record(
+        self,
+        name: str,
+        seconds: Optional[float] = None,
+        rows: int = 0,
+        nbytes: int = 0,
+        retries: int = 0,
+    ) -> None:
+        with self.lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = stage_stats()
+            if seconds is not None:
+                stats.calls += 1
+                stats.seconds += seconds
+                stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.rows += rows
+            stats.bytes += nbytes
+            stats.retries += retries
+        log.info(
+            json.dumps(
+                dict(
+                    idhash=config.IDHASH,
+                    stage=name,
+                    seconds=seconds,
+                    rows=rows,
+                    bytes=nbytes,
+                    retries=retries,
+                ),
+                ensure_ascii=False,
+            )
+        )
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self.lock:
+            return dict(
+                (name, stats.as_dict()) for name, stats in self.stages.items()
+            )
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stages.clear()
+
+    def log_summary(self) -> None:
+        for name, stats in sorted(self.snapshot().items()):
+            log.info(
+                json.dumps(
+                    dict(idhash=config.IDHASH, summary=name, **stats),
+                    ensure_ascii=False,
+                )
+            )
+
+
+METRICS = metrics_registry()
+
+
+class timed_stage:
+    """
+    context manager timing one run of a stage, counts may be added inside
+    """
+
+    __slots__ = ("name", "rows", "nbytes", "retries", "start")
+
+    def __init__(self, name: str, rows: int = 0, nbytes: int = 0) -> None:
+        self.name = name
+        self.rows = rows
+        self.nbytes = nbytes
+        self.retries = 0
+
+    def add(self, rows: int = 0, nbytes: int = 0, retries: int = 0) -> None:
+        self.rows += rows
+        self.nbytes += nbytes
+        self.retries += retries
+
+    def __enter__(self) -> "timed_stage":
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        METRICS.record(
+            self.name,
+            perf_counter() - self.start,
+            self.rows,
+            self.nbytes,
+            self.retries,
+        )
+
+
+class null_stage:
+    __slots__ = ()
+
+    def add(self, rows: int = 0, nbytes: int = 0, retries: int = 0) -> None:
+        pass
+
+    def __enter__(self) -> "null_stage":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+NULL_STAGE = null_stage()
+
+
+def enable(enabled: bool = True) -> None:
+    global ENABLED
+    ENABLED = enabled
+
+
+def stage(name: str, rows: int = 0, nbytes: int = 0):
+    """
+    `with stage("gtables.download") as s: ... s.add(rows=len(df))`
+    """
+    if not ENABLED:
+        return NULL_STAGE
+    return timed_stage(name, rows, nbytes)
+
+
+def count(name: str, rows: int = 0, nbytes: int = 0, retries: int = 0):
+    """
+    counters of a stage without timing, like retries
+    """
+    if ENABLED:
+        METRICS.record(name, None, rows, nbytes, retries)
+
+
+def get_size(data) -> int:
+    """
+    utf-8 size of str or bytes input, json size of lists of sheet rows,
+    deep memory of dataframes while metrics are on, else 0
+    """
+    if not ENABLED:
+        return 0
+    if isinstance(data, str):
+        return len(data.encode("utf8"))
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    if isinstance(data, (list, tuple)):
+        # NOTE what the body of a request to the sheets api weighs
+        return len(
+            json.dumps(data, ensure_ascii=False, default=str).encode("utf8")
+        )
+    if hasattr(data, "memory_usage"):
+        return int(data.memory_usage(index=False, deep=True).sum())
+    return 0
+
+
+def timed(name: str) -> Callable:
+    """
+    decorator timing every call of a function as stage `name`
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with timed_stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
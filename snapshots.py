@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from hashlib import md5
+from pathlib import Path
+from typing import Mapping, Optional, Tuple, Union
+
+from pandas import DataFrame, read_parquet, read_pickle
+
+from utils.utils import get_data_dir
+
+log = logging.getLogger(__name__)
+
+DIR_SNAPSHOTS = "gtables-snapshots"
+SNAPSHOT_TTL = timedelta(days=1)
+SNAPSHOT_MAX_BYTES = 2 ** 30
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+
+
+def get_revision(spreadsheet) -> str:
+    """
+    last modification time of a spreadsheet from Drive, one small request
+    """
+    client = spreadsheet.client
+    request = getattr(client, "request", None) or client.http_client.request
+    response = request(
+        "get",
+        f"{DRIVE_FILES_URL}/{spreadsheet.id}",
+        params={"fields": "modifiedTime", "supportsAllDrives": True},
+    )
+    return response.json()["modifiedTime"]
+
+
+class snapshot_cache:
+    """
+    typed dataframes of downloaded sheets on a local disk, in parquet
+    (pickle for columns arrow can not store), reused while the spreadsheet
+    revision is the same; entries expire after `ttl`, least recently used
+    ones are evicted above `max_bytes`; `offline` serves the last snapshot
+    without asking Google at all
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[Path, str]] = None,
+        ttl: timedelta = SNAPSHOT_TTL,
+        max_bytes: int = SNAPSHOT_MAX_BYTES,
+        offline: bool = False,
+    ) -> None:
+        self.path = (
+            Path(path) if path else Path(get_data_dir(), DIR_SNAPSHOTS)
+        )
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+
+    @staticmethod
+    def get_key(
+        table: str,
+        sheet: Union[str, int],
+        read_options: Mapping,
+        column_dtypes: Mapping[str, str],
+    ) -> str:
+        schema = sorted(column_dtypes.items())
+        return md5(
+            json.dumps(
+                [table, sheet, read_options, schema], default=str
+            ).encode("utf8")
+        ).hexdigest()
+
+    def get_meta_path(self, key: str) -> Path:
+        return self.path.joinpath(f"{key}.json")
+
+    def get(
+        self, key: str, revision: Optional[str] = None
+    ) -> Optional[Tuple[DataFrame, dict]]:
+        """
+        snapshot and its meta if it is fresh and of `revision`, else None
+        """
+        meta_path = self.get_meta_path(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if not self.offline:
+            created = datetime.fromisoformat(meta["created"])
+            if datetime.now() - created > self.ttl:
+                log.info(f"снимок '{key}' устарел по времени")
+                self.remove(key)
+                return None
+            if meta["revision"] != revision:
+                log.info(f"снимок '{key}' устарел: таблица изменена")
+                return None
+        data_path = self.path.joinpath(meta["file"])
+        try:
+            dataframe = (
+                read_parquet(data_path)
+                if data_path.suffix == ".parquet"
+                else read_pickle(data_path)
+            )
+        except FileNotFoundError:
+            return None
+        os.utime(meta_path)  # NOTE recently used, evicted last
+        log.info(f"снимок '{key}' взят из кэша '{self.path}'")
+        return dataframe, meta
+
+    def put(
+        self,
+        key: str,
+        dataframe: DataFrame,
+        revision: Optional[str],
+        **meta,
+    ) -> None:
+        self.remove(key)
+        data_path = self.path.joinpath(f"{key}.parquet")
+        try:
+            dataframe.to_parquet(data_path)
+        except Exception as e:
+            # NOTE mixed types in one column, like bools and empty strings
+            log.info(f"снимок '{key}' сохраняется в pickle: '{e}'")
+            data_path.unlink(missing_ok=True)
+            data_path = self.path.joinpath(f"{key}.pkl")
+            dataframe.to_pickle(data_path)
+        meta.update(
+            file=data_path.name,
+            revision=revision,
+            created=datetime.now().isoformat(),
+        )
+        with open(self.get_meta_path(key), "w") as f:
+            json.dump(meta, f, ensure_ascii=False, default=str)
+        self.evict()
+
+    def remove(self, key: str) -> None:
+        self.get_meta_path(key).unlink(missing_ok=True)
+        for suffix in (".parquet", ".pkl"):
+            self.path.joinpath(f"{key}{suffix}").unlink(missing_ok=True)
+
+    def evict(self) -> None:
+        entries = []
+        for meta_path in self.path.glob("*.json"):
+            key = meta_path.stem
+            files = [meta_path] + list(self.path.glob(f"{key}.p*"))
+            size = sum(f.stat().st_size for f in files if f.exists())
+            entries.append((meta_path.stat().st_mtime, size, key))
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            log.info(f"снимок '{key}' вытеснен из кэша")
+            self.remove(key)
+            total -= size
+
+    def clear(self) -> None:
+        for meta_path in self.path.glob("*.json"):
+            self.remove(meta_path.stem)
@@ -0,0 +1,111 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+from pandas import DataFrame
+from pandas.testing import assert_frame_equal
+
+from utils import gtables
+from utils.gfake import fake_client, install_fake
+from utils.snapshots import snapshot_cache
+
+COLUMN_DTYPES = {"name": "string", "count": "int"}
+VALUES = [["name", "count"], ["a", 1], ["b", 2]]
+
+
+@pytest.fixture
+def client():
+    client = fake_client()
+    client.create("table").add_worksheet("sheet", VALUES)
+    previous = install_fake(client)
+    yield client
+    gtables.CLIENT_POOL = previous
+
+
+@pytest.fixture
+def secret_json(tmp_path):
+    path = tmp_path.joinpath("secret.json")
+    path.write_text("{}")
+    return path
+
+
+def download(secret_json, cache) -> DataFrame:
+    table = gtables.google_table("table", "sheet", secret_json, COLUMN_DTYPES)
+    return table.download(cache=cache)
+
+
+def get_worksheet(client):
+    (spreadsheet,) = client.spreadsheets.values()
+    return spreadsheet.worksheets[0]
+
+
+def test_hit_on_same_revision(client, secret_json, tmp_path):
+    cache = snapshot_cache(tmp_path.joinpath("cache"))
+    first = download(secret_json, cache)
+    # NOTE changed behind the revision: only a cache hit still sees "a"
+    get_worksheet(client).values[1][0] = "changed"
+    assert_frame_equal(download(secret_json, cache), first)
+
+
+def test_miss_after_revision_bump(client, secret_json, tmp_path):
+    cache = snapshot_cache(tmp_path.joinpath("cache"))
+    download(secret_json, cache)
+    get_worksheet(client).update("A2", [["changed"]])
+    assert download(secret_json, cache)["name"].tolist() == ["changed", "b"]
+
+
+def test_ttl_expiry(client, secret_json, tmp_path):
+    cache = snapshot_cache(tmp_path.joinpath("cache"))
+    download(secret_json, cache)
+    (meta_path,) = cache.path.glob("*.json")
+    meta = json.loads(meta_path.read_text())
+    meta["created"] = (datetime.now() - 2 * cache.ttl).isoformat()
+    meta_path.write_text(json.dumps(meta))
+    get_worksheet(client).values[1][0] = "changed"
+    assert download(secret_json, cache)["name"].tolist() == ["changed", "b"]
+
+
+def test_max_bytes_evicts_least_recently_used(tmp_path):
+    cache = snapshot_cache(tmp_path)
+    frame = DataFrame({"x": range(100)})
+    cache.put("first", frame, "1")
+    size = sum(path.stat().st_size for path in tmp_path.iterdir())
+    # NOTE room for two entries, not for three
+    cache.max_bytes = 2 * size + size // 2
+    cache.put("second", frame, "1")
+    os.utime(cache.get_meta_path("first"), (1, 1))
+    os.utime(cache.get_meta_path("second"), (2, 2))
+    assert cache.get("first", "1") is not None  # NOTE used again: kept
+    cache.put("third", frame, "1")
+    assert cache.get("second", "1") is None
+    assert cache.get("first", "1") is not None
+    assert cache.get("third", "1") is not None
+
+
+def test_offline_serves_last_snapshot(client, secret_json, tmp_path):
+    path = tmp_path.joinpath("cache")
+    first = download(secret_json, snapshot_cache(path))
+    get_worksheet(client).update("A2", [["changed"]])
+    requests = client.requests
+    offline = download(secret_json, snapshot_cache(path, offline=True))
+    assert_frame_equal(offline, first)
+    # NOTE no request at all, not even for the revision
+    assert client.requests == requests
+
+
+def test_offline_without_snapshot(client, secret_json, tmp_path):
+    cache = snapshot_cache(tmp_path.joinpath("cache"), offline=True)
+    with pytest.raises(KeyError):
+        download(secret_json, cache)
+
+
+def test_pickle_for_mixed_columns(tmp_path):
+    cache = snapshot_cache(tmp_path)
+    frame = DataFrame({"mixed": [True, "", 1.5]})
+    cache.put("mixed", frame, "1")
+    assert cache.path.joinpath("mixed.pkl").exists()
+    assert not cache.path.joinpath("mixed.parquet").exists()
+    dataframe, meta = cache.get("mixed", "1")
+    assert meta["file"] == "mixed.pkl"
+    assert_frame_equal(dataframe, frame)
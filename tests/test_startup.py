@@ -0,0 +1,75 @@
+"""
+import of `utils.utils` and `utils.gtables` stays cheap and side effect free
+
+    cd .. && python -m pytest utils/tests
+"""
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import utils
+
+# NOTE wall clock limits of a fresh interpreter, pandas and gspread included
+IMPORT_SECONDS = {"utils.utils": 1.5, "utils.gtables": 4.0}
+# NOTE calls `utils.config` used to make at import, see `config.LAZY`;
+# `os.uname` is left out, numpy and platform call it on their own
+SPIED = ["os.getlogin", "getpass.getuser", "locale.setlocale"]
+SCRIPT = """
+import getpass, json, locale, os, sys, time
+
+calls = []
+
+
+def spy(owner, name):
+    func = getattr(owner, name)
+
+    def wrapper(*args, **kwargs):
+        calls.append(f"{owner.__name__}.{name}")
+        return func(*args, **kwargs)
+
+    setattr(owner, name, wrapper)
+
+
+for path in SPIED:
+    owner, name = path.split(".")
+    spy(sys.modules[owner], name)
+start = time.perf_counter()
+__import__(MODULE)
+seconds = time.perf_counter() - start
+config = sys.modules["utils.config"]
+print(json.dumps(dict(
+    seconds=seconds,
+    calls=calls,
+    computed=sorted(set(config.LAZY) & set(vars(config))),
+)))
+"""
+
+
+def run_import(module: str) -> dict:
+    script = f"SPIED = {SPIED!r}\nMODULE = {module!r}\n{SCRIPT}"
+    root = Path(utils.__path__[0]).parent
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=root,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+@pytest.mark.parametrize("module", sorted(IMPORT_SECONDS))
+def test_import_time(module):
+    # NOTE the best of a few runs: a cold disk cache is not a regression
+    seconds = min(run_import(module)["seconds"] for _ in range(3))
+    assert seconds < IMPORT_SECONDS[module]
+
+
+@pytest.mark.parametrize("module", sorted(IMPORT_SECONDS))
+def test_import_side_effects(module):
+    result = run_import(module)
+    assert result["calls"] == []
+    assert result["computed"] == []
@@ -0,0 +1,40 @@
+import pytest
+from pandas import Series
+
+from utils import utils
+from utils.config import BASE_FILE_FORMAT, FORMAT_TIME_NOTE
+
+TEXTS = [
+    "20210101-1000-a\n20210102-1100-b",
+    # NOTE invalid stamps: no 31 of February, no month 13, no hour 25
+    "20210231-1000-bad 20210301-1200-ok",
+    "x20211301-1000-y20211201-2500-z20211201-2300-",
+    # NOTE adjacent stamps: the scan goes on one symbol past a stamp
+    "20210101-1000-20210101-1001-x",
+    "20210101-1000-20210101-1000-",
+    # NOTE overlapping candidates: a stamp starts inside the digits before
+    "2021010120210101-1000-tail",
+    "",
+    "no stamps",
+]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_frame_matches_parse_timestamp(text):
+    frame = utils.parse_timestamp_frame([text], BASE_FILE_FORMAT)
+    parsed = utils.parse_timestamp(text, BASE_FILE_FORMAT)
+    assert dict(zip(frame["timestamp"], frame["segment"])) == parsed
+    matches = list(utils.iter_ts_matches(text, BASE_FILE_FORMAT))
+    assert frame["start"].tolist() == [end for _, end, _ in matches]
+    for start, end, segment in frame[["start", "end", "segment"]].values:
+        assert text[start:end] == segment
+
+
+def test_frame_of_series():
+    texts = Series(TEXTS[:2] + [None], index=["a", "b", "c"])
+    frame = utils.parse_timestamp_frame(
+        texts, (BASE_FILE_FORMAT, FORMAT_TIME_NOTE), with_text=False
+    )
+    assert frame["source_id"].tolist() == ["a", "a", "b"]
+    assert list(frame.columns) == ["source_id", "timestamp", "start", "end"]
+    assert frame["timestamp"].dtype == "datetime64[s]"
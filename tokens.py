@@ -0,0 +1,147 @@
+import re
+import sys
+from itertools import chain
+from typing import Iterable, Iterator, List, NamedTuple, Tuple, Union
+
+import numpy
+
+FLAGS = re.UNICODE | re.MULTILINE | re.DOTALL
+
+
+class token_spans(NamedTuple):
+    """
+    tokens of many texts as flat offset arrays: tokens of the i-th text are
+    text[starts[j]:ends[j]] for j in range(offsets[i], offsets[i + 1])
+    """
+
+    starts: numpy.ndarray
+    ends: numpy.ndarray
+    offsets: numpy.ndarray
+
+    def get(self, num: int) -> numpy.ndarray:
+        """
+        (start, end) rows of the `num`-th text
+        """
+        first, last = self.offsets[num], self.offsets[num + 1]
+        return numpy.stack(
+            (self.starts[first:last], self.ends[first:last]), axis=1
+        )
+
+
+def get_offset_dtype(length: int) -> numpy.dtype:
+    return numpy.dtype(numpy.int32 if length < 2 ** 31 else numpy.int64)
+
+
+class regexp_tokenizer:
+    """
+    drop-in replacement of `nltk.tokenize.RegexpTokenizer`: `pattern`
+    matches tokens, or separators between them with `gaps`; the pattern is
+    compiled once and texts may be tokenized in batch, into substrings or
+    into numpy offsets without creating substrings at all
+    NOTE with `gaps` spans follow `tokenize`, empty tokens included unless
+    `discard_empty`; nltk's `span_tokenize` drops them anyway
+    """
+
+    def __init__(
+        self,
+        pattern: Union[str, re.Pattern],
+        gaps: bool = False,
+        discard_empty: bool = True,
+        flags: int = FLAGS,
+    ) -> None:
+        pattern = getattr(pattern, "pattern", pattern)
+        self.pattern = pattern
+        self.gaps = gaps
+        self.discard_empty = discard_empty
+        self.flags = flags
+        self.regexp = re.compile(pattern, flags)
+        if self.gaps and self.regexp.groups:
+            raise ValueError(
+                f"pattern '{pattern}' of gaps must not have capturing groups"
+            )
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(pattern={self.pattern!r}, "
+            f"gaps={self.gaps!r}, discard_empty={self.discard_empty!r}, "
+            f"flags={self.flags!r})"
+        )
+
+    def tokenize(self, text: str) -> List[str]:
+        if not self.gaps:
+            return self.regexp.findall(text)
+        if self.discard_empty:
+            return [token for token in self.regexp.split(text) if token]
+        return self.regexp.split(text)
+
+    def iter_spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        if not self.gaps:
+            for match in self.regexp.finditer(text):
+                yield match.span()
+            return
+        left = 0
+        for match in self.regexp.finditer(text):
+            right, next_left = match.span()
+            if right != left or not self.discard_empty:
+                yield left, right
+            left = next_left
+        if left != len(text) or not self.discard_empty:
+            yield left, len(text)
+
+    span_tokenize = iter_spans
+
+    def spans(self, text: str) -> numpy.ndarray:
+        """
+        (start, end) offsets of tokens as a (tokens, 2) array
+        """
+        flat = numpy.fromiter(
+            chain.from_iterable(self.iter_spans(text)),
+            dtype=get_offset_dtype(len(text)),
+        )
+        return flat.reshape(-1, 2)
+
+    def tokenize_many(
+        self, texts: Union[Iterable[str], "Series"], spans: bool = False
+    ) -> Union[List[List[str]], "Series", token_spans]:
+        """
+        `tokenize` of every text: a list of token lists, a Series of them
+        for a Series, or `token_spans` of all texts with `spans`
+        """
+        if spans:
+            return self.spans_many(texts)
+        tokenize = self.tokenize
+        # NOTE pandas is not imported here: without it there are no Series
+        pandas = sys.modules.get("pandas")
+        if pandas is not None and isinstance(texts, pandas.Series):
+            return pandas.Series(
+                [tokenize(text) for text in texts],
+                index=texts.index,
+                name=texts.name,
+                dtype=object,
+            )
+        return [tokenize(text) for text in texts]
+
+    def spans_many(
+        self, texts: Union[Iterable[str], "Series"]
+    ) -> token_spans:
+        counts = []
+        lengths = []
+
+        def flatten():
+            for text in texts:
+                count = 0
+                for span in self.iter_spans(text):
+                    count += 1
+                    yield from span
+                counts.append(count)
+                lengths.append(len(text))
+
+        flat = numpy.fromiter(flatten(), dtype=numpy.int64)
+        offsets = numpy.zeros(len(counts) + 1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=offsets[1:])
+        dtype = get_offset_dtype(max(lengths, default=0))
+        return token_spans(
+            flat[0::2].astype(dtype),
+            flat[1::2].astype(dtype),
+            offsets,
+        )
@@ -1,31 +1,60 @@
+import atexit
+import codecs
+import heapq
 import logging
 import os
+import re
+import subprocess
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache, partial
+from glob import glob
+from itertools import repeat
+from logging.handlers import QueueHandler, QueueListener
+from operator import itemgetter
 from pathlib import Path
-from typing import Dict, List, Literal, Optional, Tuple, TypedDict, Union
+from queue import SimpleQueue
+from typing import (
+    IO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    TypedDict,
+    Union,
+)
 
 import yaml
-from nltk.tokenize import RegexpTokenizer
 
+from utils import config, metrics
 from utils.config import (
-    DATETIME_PREFIX,
     DEBUG,
     DIR_DATA,
     DIR_DEBUG,
     DIR_LOGS,
     DISK,
-    LOG_FORMAT,
-    NAME_NODE,
+    NOTE_FORMATS,
     RE_NEWLINES,
     RE_TOKENS,
     STRFTIME,
     STRFTIME_LOCAL,
 )
+from utils.tokens import regexp_tokenizer
 
 log = logging.getLogger(__name__)
+log_listener: Optional[QueueListener] = None
+
+CHUNK_SIZE = 2 ** 20
+TIMESTAMP_STEP = timedelta(seconds=1)
 
 
+@lru_cache(maxsize=None)
 def get_debug_dir() -> str:
     """
     return absolute path for a folder for storing debug logs inside Yandex Disk
@@ -38,6 +67,7 @@ def get_debug_dir() -> str:
     return str(debug_dir_abspath)
 
 
+@lru_cache(maxsize=None)
 def get_logs_dir() -> str:
     """
     return absolute path for a folder for storing logs inside Yandex Disk
@@ -46,7 +76,7 @@ def get_logs_dir() -> str:
     yadisk_abspath = get_yadisk_abspath()
     yadisk_abspath = Path(yadisk_abspath)
     logs_dir_abspath = yadisk_abspath.joinpath(DIR_LOGS)
-    logs_dir_abspath.mkdir_p()
+    logs_dir_abspath.mkdir(exist_ok=True)
     return str(logs_dir_abspath)
 
 
@@ -69,24 +99,48 @@ def validate_path(path_obj: Path, endswith: str, gracefull: bool = False):
     exit()
 
 
+def stop_logging() -> None:
+    """
+    flush queued records and stop the background writer
+    """
+    global log_listener
+    if log_listener:
+        log_listener.stop()
+        for handler in log_listener.handlers:
+            handler.close()
+        log_listener = None
+
+
 def make_logging_config(
     debug=DEBUG, in_file=True, open_for_debug: bool = False
 ):
     """
     1) устанавливает единый формат записи журнала
     2) перенапраялвет потоки в файл
+    records are only queued by the caller, a background `QueueListener`
+    writes them, so hot paths never wait for the (cloud synced) disk
     """
-    # TODO работает долго и нуждается в профилировании: вызов делается 1.22 сек на личном макбуке
+    global log_listener
     if in_file:
-        filename = f'{DATETIME_PREFIX}{NAME_NODE}{"-DEBUG"if debug else ""}.log'
+        filename = f'{config.DATETIME_PREFIX}{config.NAME_NODE}{"-DEBUG"if debug else ""}.log'
         logdir = Path(get_debug_dir() if debug else get_logs_dir())
         logfile = Path.joinpath(logdir, filename)
+        handler = logging.FileHandler(logfile, delay=True, encoding="utf-8")
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(config.LOG_FORMAT))
+    stop_logging()
+    queue = SimpleQueue()
+    queue_handler = QueueHandler(queue)
+    # NOTE message only: the listener's handler applies `LOG_FORMAT`
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
     logging.basicConfig(
         level=logging.DEBUG if debug else logging.INFO,
-        format=LOG_FORMAT,
-        filename=logfile if in_file else None,
+        handlers=[queue_handler],
         force=True,  # python 3.8+ required
     )
+    log_listener = QueueListener(queue, handler)
+    log_listener.start()
     log = logging.getLogger(__name__)
     log.info("start")
     log.debug("this is test run") if debug else log.info(
@@ -98,47 +152,19 @@ def make_logging_config(
     return
 
 
+atexit.register(stop_logging)
+
+
 def check_ts_mask(candidate, timestamp):
-    cnt = 0
-    itrtr = 0
-    # NOTE Интересно посмотреть на обработку цикла для кириллического timestamp
-    while cnt < len(timestamp):
-        if itrtr >= len(candidate):
-            return False
-        if timestamp[cnt] == "%":
-            pass
-        elif timestamp[cnt] in STRFTIME.keys():
-            num_digits = STRFTIME[timestamp[cnt]] + itrtr
-            while itrtr < num_digits:
-                if candidate[itrtr] not in set("1234567890"):
-                    return False
-                itrtr += 1
-        elif timestamp[cnt] in STRFTIME_LOCAL.keys():
-            length = STRFTIME_LOCAL[timestamp[cnt]]["num"]
-            values = STRFTIME_LOCAL[timestamp[cnt]]["values"]
-            if candidate[itrtr : itrtr + length] in values:
-                itrtr += length
-                # NOTE Работает ли .isalpha() для Кириллиц?
-                while candidate[itrtr].isalpha():
-                    if itrtr >= len(candidate):
-                        return False
-                    itrtr += 1
-            else:
-                return False
-        else:
-            if timestamp[cnt] != candidate[itrtr]:
-                return False
-            itrtr += 1
-            pass
-        cnt += 1
-        continue
-    try:
-        return datetime.strptime(
-            candidate, timestamp
-        )  # without [:num_digits] may cause ValueError: unconverted data remains: :29.761Z - отсекаем хвост по кол-ву нужных цифр
-    except ValueError:
-        pass
-    return False
+    """
+    datetime of a whole `candidate` stamp in `timestamp` format, else False
+    names are read from `config.STRFTIME_LOCAL`, the locale is not used
+    """
+    mask = compile_ts_mask(timestamp)
+    match = mask.regex.fullmatch(candidate)
+    if not match:
+        return False
+    return mask.to_datetime(match) or False
 
 
 def get_ts_candidat_len(timestamp):
@@ -161,70 +187,466 @@ def get_ts_candidat_len(timestamp):
     return ts_len
 
 
-def parse_timestamp(text, timestamp, index=None):
+class ts_mask(NamedTuple):
+    timestamp: str
+    regex: re.Pattern
+    fields: Tuple[str, ...]
+    max_len: int
+
+    def to_datetime(self, match: re.Match) -> Optional[datetime]:
+        return self.parse(match.group(), match.groups())
+
+    def parse(self, stamp: str, groups: Sequence[str]) -> Optional[datetime]:
+        """
+        datetime of a matched `stamp` with its field `groups`, None if invalid
+        NOTE a week day name is not checked against the date, as by strptime
+        """
+        values = dict()
+        for field, group in zip(self.fields, groups):
+            if field == "B":
+                values["m"] = STRFTIME_LOCAL["B"]["values"][group.lower()]
+            elif field != "A":
+                values[field] = int(group)
+        try:
+            return datetime(
+                values.get("Y", 1900),
+                values.get("m", 1),
+                values.get("d", 1),
+                values.get("H", 0),
+                values.get("M", 0),
+            )
+        except ValueError:
+            return None
 
-    ts_len = get_ts_candidat_len(timestamp)
-    size = len(text)
-    cnt, current, res = 0, -1, dict()
-    if size == 0:
-        return res
+    def resolve(self, match: re.Match) -> Optional[Tuple[int, datetime, str]]:
+        """
+        (end, datetime, format) of a regex match, None if the date is invalid
+        """
+        ts = self.to_datetime(match)
+        if ts is None:
+            return None
+        return match.end(), ts, self.timestamp
 
-    while cnt < size:
-        if ts_len and cnt + ts_len > size:
-            break
-        ts = check_ts_mask(text[cnt : cnt + ts_len], timestamp)
-        if not ts:
+
+@lru_cache(maxsize=None)
+def compile_ts_mask(timestamp: str) -> ts_mask:
+    """
+    compile strftime string into a regular expression, cached per format
+    %A and %B match names of `config.STRFTIME_LOCAL` tables in any case
+    """
+    cnt, parts, fields, max_len = 0, [], [], 0
+    seen = set()
+    while cnt < len(timestamp):
+        if timestamp[cnt] == "%":
+            if cnt + 1 >= len(timestamp):
+                raise ValueError(
+                    f"Wrong timestamp format '{timestamp}': can not correctly parse symbol at index {cnt}"
+                )
             cnt += 1
-            continue
-        if current != -1:
-            key_candidat = datetime.strptime(
-                text[current : current + ts_len], timestamp,
-            )
-            if index:
-                while True:
-                    if key_candidat in index:
-                        key_candidat += timedelta(seconds=1)
-                    else:
-                        index |= set([key_candidat])
-                        break
+            if timestamp[cnt] in STRFTIME.keys():
+                parts.append(f"([0-9]{{{STRFTIME[timestamp[cnt]]}}})")
+                max_len += STRFTIME[timestamp[cnt]]
+            elif timestamp[cnt] in STRFTIME_LOCAL.keys():
+                values = STRFTIME_LOCAL[timestamp[cnt]]["values"]
+                # NOTE longer names first: "марта" before "мар"
+                names = "|".join(
+                    map(re.escape, sorted(values, key=len, reverse=True))
+                )
+                parts.append(f"((?i:{names}))(?![^\\W\\d_])")
+                # NOTE and the symbol after a name, checked by the lookahead
+                max_len += STRFTIME_LOCAL[timestamp[cnt]]["num"] + 1
             else:
-                index = set([key_candidat])
-            res[key_candidat] = text[current + ts_len : cnt]
-        current = cnt
+                raise ValueError(f"Unknown modifier '{timestamp[cnt]}'")
+            field = "m" if timestamp[cnt] == "B" else timestamp[cnt]
+            if field in seen:
+                raise ValueError(
+                    f"Wrong timestamp format '{timestamp}': repeated field '%{timestamp[cnt]}'"
+                )
+            if field != "A":
+                seen.add(field)
+            fields.append(timestamp[cnt])
+        elif timestamp[cnt] in STRFTIME.keys() or timestamp[cnt] in (
+            STRFTIME_LOCAL.keys()
+        ):
+            # NOTE `check_ts_mask` wants digits here but strptime a letter
+            parts, max_len = ["(?!)"], 0
+            break
+        else:
+            parts.append(re.escape(timestamp[cnt]))
+            max_len += 1
         cnt += 1
-        cnt += ts_len
+    return ts_mask(
+        timestamp, re.compile("".join(parts)), tuple(fields), max_len
+    )
 
-    if current == -1:
-        return res
 
-    key_candidat = datetime.strptime(
-        text[current : current + ts_len], timestamp
+class ts_masks(NamedTuple):
+    """
+    several formats as one alternation of their `ts_mask` regexes: at one
+    position the first listed format with a valid date wins
+    """
+
+    timestamps: Tuple[str, ...]
+    regex: re.Pattern
+    masks: Tuple[ts_mask, ...]
+    # NOTE index of the outer group of a format -> number of the format
+    groups: Dict[int, int]
+    max_len: int
+
+    def resolve(self, match: re.Match) -> Optional[Tuple[int, datetime, str]]:
+        group = match.lastindex
+        num = self.groups[group]
+        mask = self.masks[num]
+        ts = mask.parse(
+            match.group(group),
+            match.groups()[group : group + len(mask.fields)],
+        )
+        if ts is not None:
+            return match.end(), ts, mask.timestamp
+        # NOTE the alternation stops at the first matching format, formats
+        # listed later may still have a valid date at the same position
+        for mask in self.masks[num + 1 :]:
+            other = mask.regex.match(match.string, match.start())
+            if other:
+                resolved = mask.resolve(other)
+                if resolved is not None:
+                    return resolved
+        return None
+
+
+def get_ts_head(timestamp: str) -> Optional[str]:
+    """
+    regex character set of the first symbol of a `timestamp` stamp, None if
+    any symbol may start it
+    """
+    if not timestamp.startswith("%"):
+        return re.escape(timestamp[:1]) or None
+    modifier = timestamp[1:2]
+    if modifier in STRFTIME.keys():
+        return "0-9"
+    if modifier in STRFTIME_LOCAL.keys():
+        values = STRFTIME_LOCAL[modifier]["values"]
+        heads = set(value[0] for value in values)
+        heads |= set(head.upper() for head in heads)
+        return "".join(sorted(map(re.escape, heads)))
+    return None
+
+
+@lru_cache(maxsize=None)
+def compile_ts_masks(timestamps: Tuple[str, ...]) -> ts_masks:
+    """
+    compile strftime strings into one regular expression, cached per tuple
+    """
+    masks = tuple(map(compile_ts_mask, timestamps))
+    parts, groups, group = [], dict(), 1
+    for num, mask in enumerate(masks):
+        parts.append(f"({mask.regex.pattern})")
+        groups[group] = num
+        group += mask.regex.groups + 1
+    pattern = "|".join(parts)
+    heads = list(map(get_ts_head, timestamps))
+    if heads and None not in heads:
+        # NOTE an alternation is searched at every position, a set of first
+        # symbols ahead of it lets `re` skip to candidates as for one format
+        pattern = f"(?=[{''.join(sorted(set(heads)))}])(?:{pattern})"
+    return ts_masks(
+        tuple(timestamps),
+        re.compile(pattern),
+        masks,
+        groups,
+        max((mask.max_len for mask in masks), default=0),
     )
-    if index:
-        while True:
-            if key_candidat in index:
-                key_candidat += timedelta(seconds=1)
-            else:
-                index |= set([key_candidat])
+
+
+def get_ts_mask(
+    timestamp: Union[str, Sequence[str]]
+) -> Union[ts_mask, ts_masks]:
+    if isinstance(timestamp, str):
+        return compile_ts_mask(timestamp)
+    return compile_ts_masks(tuple(timestamp))
+
+
+class ts_detection(NamedTuple):
+    start: int
+    end: int
+    ts: datetime
+    # NOTE strftime string of the matched format
+    timestamp: str
+
+
+def iter_ts_detections(
+    text: str,
+    timestamps: Union[str, Sequence[str]] = NOTE_FORMATS,
+    pos: int = 0,
+) -> Iterator[ts_detection]:
+    """
+    yield every timestamp of `text` in any of `timestamps` formats with the
+    format it matched, all formats are searched in a single pass
+    """
+    mask = get_ts_mask(timestamps)
+    size = len(text)
+    while pos < size:
+        match = mask.regex.search(text, pos)
+        if not match:
+            return
+        resolved = mask.resolve(match)
+        if resolved is None:
+            pos = match.start() + 1
+            continue
+        end, ts, timestamp = resolved
+        yield ts_detection(match.start(), end, ts, timestamp)
+        pos = end + 1
+
+
+def iter_ts_matches(
+    text: str, timestamp: Union[str, Sequence[str]], pos: int = 0
+) -> Iterator[Tuple[int, int, datetime]]:
+    """
+    yield (start, end, datetime) for every timestamp of `text`
+    in the order and with the skips `parse_timestamp` scans them
+    """
+    for start, end, ts, _ in iter_ts_detections(text, timestamp, pos):
+        yield start, end, ts
+
+
+class timestamp_index:
+    """
+    set of taken timestamps giving a colliding key "+1s until free",
+    runs of taken seconds are jumped over with path compression,
+    so thousands of equal keys cost linear time instead of quadratic
+    """
+
+    def __init__(self, taken: Optional[set] = None) -> None:
+        self.taken = set() if taken is None else taken
+        # NOTE key -> timestamp with every second in [key, timestamp) taken
+        self.next_free = dict()
+
+    def __contains__(self, key: datetime) -> bool:
+        return key in self.taken
+
+    def __len__(self) -> int:
+        return len(self.taken)
+
+    def add(self, key: datetime) -> datetime:
+        path = []
+        while key in self.taken:
+            path.append(key)
+            key = self.next_free.get(key, key + TIMESTAMP_STEP)
+        self.taken.add(key)
+        for taken in path:
+            self.next_free[taken] = key + TIMESTAMP_STEP
+        return key
+
+
+def iter_chunks(
+    source: Union[str, bytes, IO, Iterable[Union[str, bytes]]],
+    chunk_size: int = CHUNK_SIZE,
+    encoding: str = "utf-8",
+) -> Iterator[str]:
+    """
+    text chunks from a string, a file handle, an mmap or an iterator of
+    chunks; bytes are decoded incrementally, so multibyte symbols may straddle
+    """
+    if isinstance(source, (str, bytes)):
+        source = [source]
+    elif hasattr(source, "read"):
+        handle = source
+        source = iter(lambda: handle.read(chunk_size), handle.read(0))
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in source:
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        if chunk:
+            yield chunk
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_timestamp_segments(
+    source: Union[str, bytes, IO, Iterable[Union[str, bytes]]],
+    timestamp: Union[str, Sequence[str]],
+    index=None,
+    chunk_size: int = CHUNK_SIZE,
+    encoding: str = "utf-8",
+) -> Iterator[Tuple[datetime, str]]:
+    """
+    streaming `parse_timestamp`: yield (datetime, segment) as soon as the
+    next timestamp closes the segment; timestamps may straddle chunks
+    and only the current segment is kept in memory
+    a sequence of formats is searched at once, see `compile_ts_masks`
+    """
+    mask = get_ts_mask(timestamp)
+    if not isinstance(index, timestamp_index):
+        # NOTE a caller's non-empty set is extended in place, as before
+        index = timestamp_index(index or None)
+    # NOTE scanned text of the open segment, joined once when it closes
+    pieces: List[str] = []
+    buf, pos, current, current_ts = "", 0, -1, None
+    chunks = iter_chunks(source, chunk_size, encoding)
+    final = False
+    while not final:
+        chunk = next(chunks, None)
+        final = chunk is None
+        buf += chunk or ""
+        # NOTE a match closer than `max_len` to the end may grow with new data
+        last_start = len(buf) - (0 if final else mask.max_len)
+        while pos < len(buf):
+            match = mask.regex.search(buf, pos)
+            if not match or match.start() > last_start:
+                if not final:
+                    pos = max(pos, last_start + 1)
                 break
-    res[key_candidat] = text[current + ts_len :]
-    return res
+            resolved = mask.resolve(match)
+            if resolved is None:
+                pos = match.start() + 1
+                continue
+            if current != -1:
+                pieces.append(buf[current : match.start()])
+                yield index.add(current_ts), "".join(pieces)
+                pieces.clear()
+            current, current_ts, _ = resolved
+            pos = current + 1
+        # NOTE no stamp starts before `pos` any more: the buffer keeps only
+        # the tail, so an open segment is not copied again with every chunk
+        keep = min(pos, len(buf))
+        if current != -1:
+            pieces.append(buf[current:keep])
+            current = 0
+        buf, pos = buf[keep:], pos - keep
+
+    if current == -1:
+        return
+
+    pieces.append(buf[current:])
+    yield index.add(current_ts), "".join(pieces)
 
 
+def parse_timestamp(text, timestamp, index=None):
+    nbytes = metrics.get_size(text)
+    with metrics.stage("utils.parse_timestamp", nbytes=nbytes) as stage:
+        parsed = dict(iter_timestamp_segments(text, timestamp, index))
+        stage.add(rows=len(parsed))
+    return parsed
+
+
+def parse_timestamp_file(
+    path: Union[str, Path], timestamp: str, encoding: str = "utf-8"
+) -> Dict[datetime, str]:
+    with metrics.stage("utils.parse_timestamp_file") as stage:
+        with open(path, encoding=encoding) as f:
+            parsed = dict(iter_timestamp_segments(f, timestamp))
+            stage.add(rows=len(parsed), nbytes=f.tell())
+    return parsed
+
+
+@metrics.timed("utils.parse_timestamp_files")
+def parse_timestamp_files(
+    path: Union[str, Path],
+    timestamp: str,
+    pattern: str = "*.txt",
+    workers: Optional[int] = None,
+    chunksize: int = 1,
+    encoding: str = "utf-8",
+) -> Dict[datetime, str]:
+    """
+    `parse_timestamp` for every note of a directory (matching `pattern`)
+    or of a glob like "~/notes/*.txt", files are spread over a process pool
+    results are merged in sorted filename order by `dict_union_with_ts_as_key`
+    so the output does not depend on `workers`
+    """
+    path = Path(path).expanduser()
+    if path.is_dir():
+        files = sorted(path.glob(pattern))
+    else:
+        files = sorted(map(Path, glob(str(path))))
+    log.info(f"разбор {len(files)} файлов по маске '{timestamp}'")
+    parse = partial(
+        parse_timestamp_file, timestamp=timestamp, encoding=encoding
+    )
+    if workers == 1 or len(files) < 2:
+        return dict_union_with_ts_as_key(*map(parse, files))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parsed = pool.map(parse, files, chunksize=chunksize)
+        return dict_union_with_ts_as_key(*parsed)
+
+
+def parse_timestamp_frame(
+    texts: Union[Iterable[str], "Series"],
+    timestamp: Union[str, Sequence[str]],
+    with_text: bool = True,
+) -> "DataFrame":
+    """
+    columnar `parse_timestamp` of many texts, one row per segment:
+    source_id (position in `texts` or its Series index), timestamp,
+    start and end offsets of the segment and, `with_text`, the segment
+    stamps are found by `iter_ts_detections` with the same skips as
+    `parse_timestamp`, but equal timestamps stay equal, they are not
+    shifted by a second
+    """
+    import numpy
+    from pandas import DataFrame, Series
+
+    if isinstance(texts, Series):
+        source_ids, texts = texts.index, texts.tolist()
+    else:
+        texts = list(texts)
+        source_ids = numpy.arange(len(texts))
+    sources, datetimes, starts, ends, segments = [], [], [], [], []
+    for source, text in enumerate(texts):
+        if not isinstance(text, str):
+            continue
+        found = list(iter_ts_detections(text, timestamp))
+        # NOTE a segment runs from the end of its stamp to the next stamp
+        stops = [detection.start for detection in found[1:]] + [len(text)]
+        for detection, stop in zip(found, stops):
+            sources.append(source)
+            datetimes.append(detection.ts)
+            starts.append(detection.end)
+            ends.append(stop)
+            if with_text:
+                segments.append(text[detection.end : stop])
+    frame = DataFrame(
+        dict(
+            source_id=source_ids[sources],
+            timestamp=numpy.array(datetimes, dtype="datetime64[s]"),
+            start=numpy.array(starts, dtype=numpy.int64),
+            end=numpy.array(ends, dtype=numpy.int64),
+        )
+    )
+    if with_text:
+        frame["segment"] = numpy.array(segments, dtype=object)
+    return frame
+
+
+@metrics.timed("utils.dict_union_with_ts_as_key")
 def dict_union_with_ts_as_key(*dicts):
+    index = timestamp_index()
     result_dict = dict()
     for dict_ in dicts:
         for old_key in dict_:
-            new_key = old_key
-            while True:
-                if new_key in result_dict.keys():
-                    new_key += timedelta(seconds=1)
-                else:
-                    break
-            result_dict[new_key] = dict_[old_key]
+            result_dict[index.add(old_key)] = dict_[old_key]
     return result_dict
 
 
+def merge_dicts_with_ts_as_key(*dicts):
+    """
+    k-way merge of dicts already sorted by timestamp keys into one sorted dict
+    collisions get "+1s until free" in chronological order, ties in order of
+    `dicts`; result differs from `dict_union_with_ts_as_key` only in which of
+    the colliding values is shifted
+    """
+    index = timestamp_index()
+    items = [
+        zip(dict_.keys(), repeat(num), dict_.values())
+        for num, dict_ in enumerate(dicts)
+    ]
+    return dict(
+        (index.add(key), value)
+        for key, _, value in heapq.merge(*items, key=itemgetter(0, 1))
+    )
+
+
 def mirror_dict(
     dctnr: Dict[Union[datetime, int, str], Union[datetime, int, str]]
 ) -> Dict[Union[datetime, int, str], List]:
@@ -249,16 +671,35 @@ class dtype_columns_attributes(TypedDict):
     time: Optional[List[str]]
 
 
-def get_sheet_info(
-    abspath: Path,
-) -> Tuple[
-    Dict[str, column_dtypes_attributes],
-    dtype_columns_attributes,
-    Dict[str, str],
-]:
-    validate_path(abspath, endswith=".yaml")
+class sheet_schema(NamedTuple):
+    column_dtypes: Dict[str, str]
+    dtype_columns: Dict[str, List[str]]
+    default_values: Dict[str, object]
+
+
+@lru_cache(maxsize=128)
+def load_sheet_schema(abspath: str, mtime_ns: int) -> sheet_schema:
+    """
+    parse and validate a yaml schema once per file version, `mtime_ns` is
+    only a part of the cache key
+    """
+    validate_path(Path(abspath), endswith=".yaml")
     with open(abspath) as f:
         dict_dtypes = yaml.safe_load(f)
+    if not isinstance(dict_dtypes, dict):
+        raise ValueError(f"schema '{abspath}' is not a mapping of columns")
+    for column, attributes in dict_dtypes.items():
+        dtype = None
+        if isinstance(attributes, dict):
+            dtype = attributes.get("dtype")
+        # NOTE a list of dtypes puts a column in several groups, `mirror_dict`
+        if not isinstance(dtype, (str, list)) or (
+            isinstance(dtype, list)
+            and not all(isinstance(item, str) for item in dtype)
+        ):
+            raise ValueError(
+                f"schema '{abspath}': column '{column}' needs a 'dtype' string or a list of them, got '{dtype}'"
+            )
     column_dtypes = dict([(k, dict_dtypes[k]["dtype"]) for k in dict_dtypes])
     default_values = dict(
         [
@@ -268,7 +709,41 @@ def get_sheet_info(
         ]
     )
     dtype_columns = mirror_dict(column_dtypes)
-    return (column_dtypes, dtype_columns, default_values)
+    return sheet_schema(column_dtypes, dtype_columns, default_values)
+
+
+def get_sheet_schema(abspath: Path) -> sheet_schema:
+    """
+    cached schema of a yaml file, parsed again only after it changes
+    NOTE shared between callers, `get_sheet_info` returns copies
+    """
+    try:
+        mtime_ns = Path(abspath).stat().st_mtime_ns
+    except OSError:
+        validate_path(Path(abspath), endswith=".yaml")
+        raise
+    return load_sheet_schema(str(abspath), mtime_ns)
+
+
+def get_sheet_info(
+    abspath: Path,
+) -> Tuple[
+    Dict[str, column_dtypes_attributes],
+    dtype_columns_attributes,
+    Dict[str, str],
+]:
+    schema = get_sheet_schema(abspath)
+    dtype_columns = defaultdict(list)
+    for dtype, columns in schema.dtype_columns.items():
+        dtype_columns[dtype] = list(columns)
+    return (
+        dict(
+            (column, list(dtype) if isinstance(dtype, list) else dtype)
+            for column, dtype in schema.column_dtypes.items()
+        ),
+        dtype_columns,
+        dict(schema.default_values),
+    )
 
 
 def prettify_input(
@@ -287,6 +762,7 @@ def prettify_input(
     return string
 
 
+@lru_cache(maxsize=None)
 def get_yadisk_abspath() -> str:
     home = Path(__file__).home()
     candidate = home.joinpath(DISK)
@@ -297,6 +773,7 @@ def get_yadisk_abspath() -> str:
     return str(candidate)
 
 
+@lru_cache(maxsize=None)
 def get_data_dir() -> str:
     """
     return absolute path for a folder storing any kind of data inside Yandex Disk
@@ -309,15 +786,30 @@ def get_data_dir() -> str:
     return str(data_dir_abspath)
 
 
-tokenizerWhtsps = RegexpTokenizer(
+tokenizerWhtsps = regexp_tokenizer(
     pattern=RE_TOKENS, gaps=True, discard_empty=False
 )
-tokenizerTokens = RegexpTokenizer(pattern=RE_TOKENS, gaps=False)
+tokenizerTokens = regexp_tokenizer(pattern=RE_TOKENS, gaps=False)
 
-tokenizerWhtspsNewline = RegexpTokenizer(
+tokenizerWhtspsNewline = regexp_tokenizer(
     pattern=RE_NEWLINES, gaps=True, discard_empty=False
 )
-tokenizerTokensNewline = RegexpTokenizer(pattern=RE_NEWLINES, gaps=False)
+tokenizerTokensNewline = regexp_tokenizer(pattern=RE_NEWLINES, gaps=False)
+
+
+def get_git_commit(path: Union[Path, str] = ".") -> str:
+    """
+    current commit of a repository, empty string outside of git
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=path,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        return ""
 
 
 def log_params(params: list) -> None: